@@ -0,0 +1,100 @@
+"""The Book of Answers, loaded once from ``answers.json``.
+
+Each entry has split English/Chinese text, a category tag and a weight.
+Draws use Vose's alias method, so picking an answer costs O(1) however the
+weights are set. A draw can also be seeded from the question, so asking
+the same question always opens the same page. That makes the result
+reproducible and lets the interpretation cache hit.
+"""
+
+import hashlib
+import json
+import random
+from dataclasses import dataclass
+
+from interpretation_cache import normalize_question
+
+
+@dataclass(frozen=True)
+class Answer:
+    en: str
+    zh: str
+    category: str
+    weight: float = 1.0
+
+    @property
+    def text(self):
+        """The bilingual form shown in the report, e.g. ``"Yes / 是的"``."""
+        return f"{self.en} / {self.zh}"
+
+
+class AliasSampler:
+    """Vose's alias method: O(n) setup, O(1) weighted draws."""
+
+    def __init__(self, weights):
+        n = len(weights)
+        if n == 0:
+            raise ValueError("cannot sample from an empty list")
+        total = float(sum(weights))
+        if total <= 0 or any(weight < 0 for weight in weights):
+            raise ValueError("weights must be non-negative and not all zero")
+        scaled = [weight * n / total for weight in weights]
+        self._prob = [0.0] * n
+        self._alias = [0] * n
+        small = [i for i, p in enumerate(scaled) if p < 1.0]
+        large = [i for i, p in enumerate(scaled) if p >= 1.0]
+        while small and large:
+            s, l = small.pop(), large.pop()
+            self._prob[s] = scaled[s]
+            self._alias[s] = l
+            scaled[l] -= 1.0 - scaled[s]
+            (small if scaled[l] < 1.0 else large).append(l)
+        for i in small + large:
+            self._prob[i] = 1.0
+
+    def sample(self, rng=random):
+        i = rng.randrange(len(self._prob))
+        return i if rng.random() < self._prob[i] else self._alias[i]
+
+
+class AnswerBook:
+    def __init__(self, answers, categories):
+        self.answers = list(answers)
+        self.categories = categories
+        self.by_category = {}
+        for answer in self.answers:
+            if answer.category not in categories:
+                raise ValueError(f"answer {answer.text!r} has unknown category {answer.category!r}")
+            self.by_category.setdefault(answer.category, []).append(answer)
+        self._by_text = {answer.text: answer for answer in self.answers}
+        self._sampler = AliasSampler([answer.weight for answer in self.answers])
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        answers = [Answer(**entry) for entry in data["answers"]]
+        return cls(answers, data["categories"])
+
+    def __len__(self):
+        return len(self.answers)
+
+    def find(self, text):
+        """Look an answer up by its bilingual text, or return ``None``."""
+        return self._by_text.get(text)
+
+    def guidance(self, answer):
+        """One-line instruction for the model about this answer's category."""
+        return self.categories[answer.category]["guidance"]
+
+    def draw(self, question=None, salt=""):
+        """Draw a weighted random answer.
+
+        With a ``question``, the draw is seeded from a hash of the normalized
+        question plus ``salt``, so the same question gets the same answer.
+        """
+        if question is None:
+            return self.answers[self._sampler.sample()]
+        digest = hashlib.blake2b(f"{salt}\0{normalize_question(question)}".encode("utf-8"), digest_size=8)
+        rng = random.Random(int.from_bytes(digest.digest(), "big"))
+        return self.answers[self._sampler.sample(rng)]
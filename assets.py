@@ -0,0 +1,194 @@
+"""Build the page's static CSS/HTML once and serve images and fonts locally.
+
+The stylesheet and background markup live in ``assets/`` and are minified
+once per process. The star layer and the web fonts are served from
+``static/`` via Streamlit's static file serving, so the first paint needs
+no third-party round trips and the app also works offline. Static URLs carry
+a content hash so browsers can keep them cached until the file changes.
+
+The background comes in three render-quality tiers, switched on the client
+with a ``data-quality`` attribute on ``<html>``. ``full`` has every layer and
+animation. ``reduced`` keeps one star layer, compositor-only transforms and
+no filters or animated shadows. ``static`` shows one pre-rendered image. A
+small script picks the tier in the browser (see :func:`quality_script`),
+unless the user or the operator chose one.
+
+The web fonts (all under the SIL Open Font License) belong in
+``static/fonts``, downloaded once at deploy time with
+``python assets.py fetch-fonts``. Rendering a page never downloads or
+writes anything: when ``static/fonts/fonts.css`` is missing, the page
+imports the fonts from Google Fonts in the browser instead, as it did
+before, so the title keeps its Orbitron and Great Vibes faces.
+"""
+
+import hashlib
+import random
+import re
+import sys
+import urllib.request
+from pathlib import Path
+from string import Template
+
+ROOT = Path(__file__).resolve().parent
+ASSETS_DIR = ROOT / "assets"
+STATIC_DIR = ROOT / "static"
+FONTS_DIR = STATIC_DIR / "fonts"
+FONTS_CSS = FONTS_DIR / "fonts.css"
+STARFIELD = STATIC_DIR / "starry.svg"
+STATIC_BACKGROUND = STATIC_DIR / "background-static.svg"
+
+# 画质档位；auto 在浏览器里按 prefers-reduced-motion 和实测帧率选择
+QUALITY_TIERS = ("full", "reduced", "static")
+# 帧率探测：测 2 秒，至少 45 fps 用 full，至少 24 fps 用 reduced，否则 static
+PROBE_SECONDS = 2
+FULL_TIER_FPS = 45
+REDUCED_TIER_FPS = 24
+
+# Streamlit 静态文件的访问路径（相对于页面地址）
+STATIC_URL = "app/static"
+
+GOOGLE_FONTS_URL = (
+    "https://fonts.googleapis.com/css2"
+    "?family=Bricolage+Grotesque:opsz,wght@10..48,200;10..48,800"
+    "&family=Orbitron:wght@500;700;900&family=Great+Vibes&display=swap"
+)
+# Google Fonts 只对现代浏览器返回 woff2
+WOFF2_USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36"
+
+
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
+
+
+def minify_html(html):
+    html = re.sub(r"<!--.*?-->", "", html, flags=re.S)
+    html = re.sub(r">\s+<", "><", html)
+    return re.sub(r"\s+", " ", html).strip()
+
+
+def static_url(path):
+    """URL of a file under ``static/`` with a content hash for cache busting."""
+    digest = hashlib.sha1((STATIC_DIR / path).read_bytes()).hexdigest()[:10]
+    return f"{STATIC_URL}/{path}?v={digest}"
+
+
+def _stars(width, height, count, seed):
+    rng = random.Random(seed)
+    stars = []
+    for _ in range(count):
+        x, y = rng.uniform(0, width), rng.uniform(0, height)
+        r = rng.choice((0.6, 0.8, 1, 1.2, 1.6, 2.2))
+        opacity = rng.uniform(0.35, 1)
+        stars.append(f'<circle cx="{x:.0f}" cy="{y:.0f}" r="{r}" opacity="{opacity:.2f}"/>')
+    return f'<g fill="#fff">{"".join(stars)}</g>'
+
+
+def starfield_svg(width=1000, height=1000, count=220, seed=7):
+    """A deterministic field of small stars, used for all three parallax layers."""
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" '
+        f'preserveAspectRatio="xMidYMid slice">{_stars(width, height, count, seed)}</svg>\n'
+    )
+
+
+def static_background_svg(width=1600, height=1000, count=320, seed=7):
+    """The static tier's whole background in one image: the gradient and a denser star field."""
+    # 与 #starry-section 的 150deg 渐变大致相同
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {width} {height}" '
+        f'preserveAspectRatio="xMidYMid slice"><defs><linearGradient id="sky" x1="0.25" y1="0" x2="0.75" y2="1">'
+        f'<stop offset="0" stop-color="#0f172a"/><stop offset="1" stop-color="#1c1917"/></linearGradient></defs>'
+        f'<rect width="{width}" height="{height}" fill="url(#sky)"/>{_stars(width, height, count, seed)}</svg>\n'
+    )
+
+
+def ensure_starfield():
+    STATIC_DIR.mkdir(exist_ok=True)
+    if not STARFIELD.exists():
+        STARFIELD.write_text(starfield_svg(), encoding="utf-8")
+    if not STATIC_BACKGROUND.exists():
+        STATIC_BACKGROUND.write_text(static_background_svg(), encoding="utf-8")
+
+
+def font_face_css():
+    """@font-face rules for the fonts in ``static/fonts``.
+
+    Falls back to an ``@import`` of Google Fonts when they were not fetched.
+    """
+    if not FONTS_CSS.exists():
+        # 部署时没有运行 fetch-fonts：让浏览器像以前一样直接从 Google Fonts 加载
+        return f"@import url('{GOOGLE_FONTS_URL}');"
+    return FONTS_CSS.read_text(encoding="utf-8")
+
+
+def build_page_assets():
+    """Return the minified ``<style>`` block and background markup as one string."""
+    ensure_starfield()
+    css = font_face_css() + (ASSETS_DIR / "style.css").read_text(encoding="utf-8")
+    html = Template((ASSETS_DIR / "background.html").read_text(encoding="utf-8")).substitute(
+        starry_url=static_url("starry.svg"),
+        static_background_url=static_url("background-static.svg"),
+    )
+    return f"<style>{minify_css(css)}</style>{minify_html(html)}"
+
+
+def quality_script(tier=None):
+    """Script that sets the page's render-quality tier; ``tier=None`` lets the browser pick.
+
+    Without a tier it uses ``reduced`` when the system asks for reduced
+    motion. Otherwise it reuses the tier measured earlier on this device,
+    or counts frames for a moment with everything animated and saves the
+    result. It runs in an ``st.iframe`` and works on the parent page.
+    """
+    return Template((ASSETS_DIR / "quality.html").read_text(encoding="utf-8")).substitute(
+        tier=tier or "",
+        probe_ms=PROBE_SECONDS * 1000,
+        full_fps=FULL_TIER_FPS,
+        reduced_fps=REDUCED_TIER_FPS,
+    )
+
+
+def fetch_fonts(timeout=30):
+    """Download the latin woff2 subsets from Google Fonts into ``static/fonts``.
+
+    Returns the number of font faces saved. Raises ``ValueError`` when Google
+    Fonts answers with a stylesheet this function does not understand.
+    """
+    request = urllib.request.Request(GOOGLE_FONTS_URL, headers={"User-Agent": WOFF2_USER_AGENT})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        css = response.read().decode("utf-8")
+    FONTS_DIR.mkdir(parents=True, exist_ok=True)
+
+    local_rules = []
+    for subset, rule in re.findall(r"/\* ([\w-]+) \*/\s*(@font-face\s*{.*?})", css, flags=re.S):
+        if subset != "latin":
+            continue
+        match = re.search(r"url\((https://[^)]+)\)", rule)
+        if match is None:
+            raise ValueError(f"no font URL in Google Fonts rule: {rule}")
+        url = match.group(1)
+        filename = url.rsplit("/", 1)[-1]
+        if not (FONTS_DIR / filename).exists():
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                (FONTS_DIR / filename).write_bytes(response.read())
+        local_rules.append(rule.replace(url, f"{STATIC_URL}/fonts/{filename}"))
+    if not local_rules:
+        raise ValueError("Google Fonts returned no latin font faces")
+    # fonts.css 最后写：下载到一半失败时，页面继续用 Google Fonts，重新运行即可补全
+    FONTS_CSS.write_text("\n".join(local_rules) + "\n", encoding="utf-8")
+    return len(local_rules)
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["fetch-fonts"]:
+        try:
+            print(f"Saved {fetch_fonts()} font faces to {FONTS_DIR}")
+        except (OSError, ValueError) as e:
+            sys.exit(f"fetch-fonts failed: {e}")
+    else:
+        print("usage: python assets.py fetch-fonts")
+        sys.exit(2)
@@ -0,0 +1,115 @@
+"""Micro-batching of concurrent interpretation requests.
+
+Questions that arrive within a short window, from any session, are sent to
+the model together as one structured request. The request carries a single
+copy of the system prompt and returns one JSON interpretation per item.
+Each caller gets a :class:`concurrent.futures.Future`. Items that a
+successful batch response leaves out or garbles fall back to individual
+calls. When the batch call itself fails (the queue is full or timed out,
+the circuit is open, Groq errors), every item fails with that error.
+Retrying each item alone would only multiply the load that made it fail.
+"""
+
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+
+@dataclass
+class BatchItem:
+    question: str
+    answer: str
+    guidance: str
+    session_id: str
+    future: Future = field(default_factory=Future)
+    submitted: float = field(default_factory=time.monotonic)
+    dispatched: float = None
+    batch_size: int = 0
+
+
+class MicroBatcher:
+    def __init__(self, run_batch, run_single, window_seconds=0.1, max_batch=8, max_workers=4):
+        """``run_batch(items)`` returns ``{index: text}``; ``run_single(item)`` returns text."""
+        self.window_seconds = window_seconds
+        self.max_batch = max_batch
+        self._run_batch = run_batch
+        self._run_single = run_single
+        self._pending = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="micro-batch")
+        self._lock = threading.Lock()
+        self._sizes = deque(maxlen=500)
+        self._waits = deque(maxlen=500)
+        self.batches = 0
+        self.items = 0
+        self.fallbacks = 0
+        threading.Thread(target=self._collect, name="micro-batch-collector", daemon=True).start()
+
+    def submit(self, question, answer, guidance, session_id):
+        item = BatchItem(question, answer, guidance, session_id)
+        self._pending.put(item)
+        return item
+
+    def stats(self):
+        with self._lock:
+            sizes, waits = list(self._sizes), list(self._waits)
+            return {
+                "batches": self.batches,
+                "items": self.items,
+                "fallbacks": self.fallbacks,
+                "avg_batch_size": sum(sizes) / len(sizes) if sizes else 0.0,
+                "max_batch_size": max(sizes, default=0),
+                "avg_added_wait": sum(waits) / len(waits) if waits else 0.0,
+                "window_seconds": self.window_seconds,
+            }
+
+    def _collect(self):
+        while True:
+            batch = [self._pending.get()]
+            deadline = time.monotonic() + self.window_seconds
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._pending.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._dispatch, batch)
+
+    def _dispatch(self, batch):
+        now = time.monotonic()
+        with self._lock:
+            self.batches += 1
+            self.items += len(batch)
+            self._sizes.append(len(batch))
+            for item in batch:
+                item.dispatched = now
+                item.batch_size = len(batch)
+                self._waits.append(now - item.submitted)
+
+        try:
+            results = self._run_batch(batch) if len(batch) > 1 else {}
+        except Exception as e:
+            for item in batch:
+                item.future.set_exception(e)
+            return
+
+        for index, item in enumerate(batch):
+            text = results.get(index)
+            if text:
+                item.future.set_result(text)
+            else:
+                # 批量结果里缺了这一条（或者只有一条），单独请求
+                if len(batch) > 1:
+                    with self._lock:
+                        self.fallbacks += 1
+                self._executor.submit(self._single, item)
+
+    def _single(self, item):
+        try:
+            item.future.set_result(self._run_single(item))
+        except Exception as e:
+            item.future.set_exception(e)
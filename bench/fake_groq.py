@@ -0,0 +1,359 @@
+"""A local stand-in for Groq's chat-completions API, for benchmarks.
+
+It answers ``POST .../chat/completions`` the way Groq does, with or without
+streaming. Usage comes in the final chunk's ``x_groq``, and batch requests
+(``response_format`` JSON) get one interpretation per item. Behaviour is
+configurable:
+
+* ``latency``: distribution of the time to first token, e.g. ``fixed:0.3``,
+  ``uniform:0.1,0.6``, ``normal:0.4,0.1`` or ``lognormal:0.4,0.5``
+  (median, sigma).
+* ``token_delay``: distribution of the gap between streamed chunks.
+* ``error_rate`` / ``rpm``: inject 429s at random, or whenever more than
+  ``rpm`` requests arrived in the last minute, with a ``Retry-After``
+  header.
+* ``playback``: replay responses from a JSONL file, one
+  ``{"content": ..., "ttft": ..., "duration": ..., "chunks": ...}`` per
+  line, cycling. Timings are optional. Without them the distributions
+  above are used.
+* ``upstream`` + ``record``: proxy to the real API and append every
+  response to a playback file.
+
+``GET /stats`` returns request and error counts. Run it on its own with::
+
+    python -m bench.fake_groq --port 8765 --latency lognormal:0.4,0.5 --error-rate 0.05
+    GROQ_BASE_URL=http://127.0.0.1:8765 GROQ_API_KEY=gsk_bench streamlit run app.py
+"""
+
+import argparse
+import itertools
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+DEFAULT_CONTENT = (
+    "The stars lean toward you; what you hope for is closer than it seems. Trust the quiet signs around you.\n"
+    "星辰偏向你，你所期待的比看起来更近。相信身边那些安静的征兆。"
+)
+
+# 流式输出时的切分：英文大致按词，连续的中文每 4 个字一段
+_PIECE = re.compile(r"\s*[^\s]{1,4}")
+
+
+class Latency:
+    """Sampler for a latency spec such as ``lognormal:0.4,0.5``; values are seconds."""
+
+    def __init__(self, spec, rng=random):
+        kind, _, params = spec.partition(":")
+        self.spec = spec
+        self.kind = kind
+        self.params = [float(p) for p in params.split(",") if p]
+        self.rng = rng
+        arity = {"fixed": 1, "uniform": 2, "normal": 2, "lognormal": 2}
+        if arity.get(kind) != len(self.params):
+            raise ValueError(f"bad latency spec {spec!r}; expected e.g. fixed:0.3, uniform:0.1,0.5, lognormal:0.4,0.5")
+
+    def sample(self):
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0]
+        elif self.kind == "uniform":
+            value = self.rng.uniform(p[0], p[1])
+        elif self.kind == "normal":
+            value = self.rng.gauss(p[0], p[1])
+        else:
+            value = self.rng.lognormvariate(math.log(p[0]), p[1])
+        return max(value, 0.0)
+
+
+class FakeGroq:
+    def __init__(
+        self,
+        host="127.0.0.1",
+        port=0,
+        latency="lognormal:0.4,0.5",
+        token_delay="fixed:0.02",
+        error_rate=0.0,
+        rpm=0,
+        retry_after=1.0,
+        playback=None,
+        upstream=None,
+        record=None,
+        seed=None,
+    ):
+        self.rng = random.Random(seed)
+        self.latency = Latency(latency, self.rng)
+        self.token_delay = Latency(token_delay, self.rng)
+        self.error_rate = error_rate
+        self.rpm = rpm
+        self.retry_after = retry_after
+        self.upstream = upstream.rstrip("/") if upstream else None
+        self.record = record
+        self._playback = itertools.cycle(self._load_playback(playback)) if playback else None
+        self._lock = threading.Lock()
+        self._arrivals = deque()
+        self.requests = 0
+        self.streamed = 0
+        self.rate_limited = 0
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+
+    @staticmethod
+    def _load_playback(path):
+        with open(path, encoding="utf-8") as f:
+            entries = [json.loads(line) for line in f if line.strip()]
+        if not entries:
+            raise ValueError(f"no recorded responses in {path}")
+        return entries
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self._server.serve_forever, name="fake-groq", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "streamed": self.streamed,
+                "rate_limited": self.rate_limited,
+            }
+
+    # --- request handling ---
+
+    def _admit(self):
+        """``None`` if the request may proceed, else the Retry-After to send with a 429."""
+        now = time.monotonic()
+        with self._lock:
+            self.requests += 1
+            while self._arrivals and now - self._arrivals[0] > 60:
+                self._arrivals.popleft()
+            if self.rpm and len(self._arrivals) >= self.rpm:
+                self.rate_limited += 1
+                return max(60 - (now - self._arrivals[0]), 0.1)
+            if self.rng.random() < self.error_rate:
+                self.rate_limited += 1
+                return self.retry_after
+            self._arrivals.append(now)
+        return None
+
+    def _next_response(self):
+        """``(content, ttft, token_delay)`` for the next reply, or ``None`` timings to sample."""
+        if self._playback is None:
+            return DEFAULT_CONTENT, None, None
+        with self._lock:
+            entry = next(self._playback)
+        content = entry.get("content") or entry.get("text", "")
+        ttft = entry.get("ttft")
+        delay = None
+        if ttft is not None and entry.get("duration") is not None:
+            delay = max(entry["duration"] - ttft, 0) / max(entry.get("chunks", 1) - 1, 1)
+        return content, ttft, delay
+
+    def _reply(self, request):
+        """Content, timings and usage for one request."""
+        content, ttft, delay = self._next_response()
+        user = request["messages"][-1]["content"]
+        if request.get("response_format", {}).get("type") == "json_object" and user.startswith("Items:"):
+            items = json.loads(user.split("\n", 1)[1])
+            content = json.dumps(
+                {"interpretations": [{"id": item["id"], "text": content} for item in items]},
+                ensure_ascii=False,
+            )
+        pieces = _PIECE.findall(content) or [content]
+        prompt_tokens = sum(len(message["content"]) for message in request["messages"]) // 4
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(pieces),
+            "total_tokens": prompt_tokens + len(pieces),
+        }
+        ttft = self.latency.sample() if ttft is None else ttft
+        return pieces, ttft, delay, usage
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.split("?")[0] != "/stats":
+                    self._json(404, {"error": {"message": "not found"}})
+                    return
+                self._json(200, fake.stats())
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.path.split("?")[0].endswith("/chat/completions"):
+                    self._json(404, {"error": {"message": "not found"}})
+                    return
+                if fake.upstream:
+                    self._proxy(body)
+                    return
+                retry_after = fake._admit()
+                if retry_after is not None:
+                    self._json(
+                        429,
+                        {"error": {"message": "Rate limit reached", "type": "requests", "code": "rate_limit_exceeded"}},
+                        {"retry-after": f"{retry_after:.2f}"},
+                    )
+                    return
+                request = json.loads(body)
+                pieces, ttft, delay, usage = fake._reply(request)
+                time.sleep(ttft)
+                if request.get("stream"):
+                    with fake._lock:
+                        fake.streamed += 1
+                    self._stream(request["model"], pieces, delay, usage)
+                else:
+                    time.sleep(sum(self._delay(delay) for _ in pieces[1:]))
+                    self._json(200, {
+                        "id": "chatcmpl-fake",
+                        "object": "chat.completion",
+                        "created": int(time.time()),
+                        "model": request["model"],
+                        "choices": [{
+                            "index": 0,
+                            "message": {"role": "assistant", "content": "".join(pieces)},
+                            "finish_reason": "stop",
+                        }],
+                        "usage": usage,
+                    })
+
+            @staticmethod
+            def _delay(delay):
+                return fake.token_delay.sample() if delay is None else delay
+
+            def _json(self, status, payload, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def _event(self, payload):
+                data = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False)
+                self._chunk(f"data: {data}\n\n".encode("utf-8"))
+
+            def _stream(self, model, pieces, delay, usage):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                chunk = {"id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": int(time.time()), "model": model}
+                try:
+                    for i, piece in enumerate(pieces):
+                        if i:
+                            time.sleep(self._delay(delay))
+                        self._event({**chunk, "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]})
+                    self._event({
+                        **chunk,
+                        "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                        "x_groq": {"id": "req_fake", "usage": usage},
+                    })
+                    self._event("[DONE]")
+                    self._chunk(b"")
+                except (BrokenPipeError, ConnectionResetError):
+                    # 客户端提前关闭（比如对冲请求输了）
+                    pass
+
+            def _proxy(self, body):
+                """Relay to the real API unchanged and record content and timings."""
+                headers = {k: v for k, v in self.headers.items() if k.lower() in ("authorization", "content-type")}
+                started = time.monotonic()
+                ttft = None
+                pieces = []
+                with httpx.stream("POST", fake.upstream + self.path, content=body, headers=headers, timeout=60) as response:
+                    self.send_response(response.status_code)
+                    self.send_header("Content-Type", response.headers.get("content-type", "application/json"))
+                    self.send_header("Transfer-Encoding", "chunked")
+                    self.end_headers()
+                    raw = b""
+                    for data in response.iter_bytes():
+                        raw += data
+                        self._chunk(data)
+                    self._chunk(b"")
+                duration = time.monotonic() - started
+                if response.status_code != 200 or not fake.record:
+                    return
+                text = raw.decode("utf-8", "replace")
+                if json.loads(body).get("stream"):
+                    for line in text.splitlines():
+                        if not line.startswith("data: {"):
+                            continue
+                        delta = json.loads(line[6:])["choices"]
+                        if delta and delta[0]["delta"].get("content"):
+                            ttft = ttft if ttft is not None else duration
+                            pieces.append(delta[0]["delta"]["content"])
+                else:
+                    pieces = [json.loads(text)["choices"][0]["message"]["content"]]
+                    ttft = duration
+                entry = {"content": "".join(pieces), "ttft": ttft, "duration": duration, "chunks": len(pieces)}
+                with fake._lock, open(fake.record, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        return Handler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for the Groq chat-completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", default="lognormal:0.4,0.5", help="time to first token (default: lognormal:0.4,0.5)")
+    parser.add_argument("--token-delay", default="fixed:0.02", help="gap between streamed chunks (default: fixed:0.02)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with a 429")
+    parser.add_argument("--rpm", type=int, default=0, help="answer 429 above this many requests per minute (0: unlimited)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds sent with injected 429s")
+    parser.add_argument("--playback", help="JSONL file of recorded responses to replay")
+    parser.add_argument("--upstream", help="proxy to this API base URL instead, e.g. https://api.groq.com")
+    parser.add_argument("--record", help="with --upstream, append responses to this JSONL file")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args(argv)
+
+    fake = FakeGroq(
+        args.host,
+        args.port,
+        latency=args.latency,
+        token_delay=args.token_delay,
+        error_rate=args.error_rate,
+        rpm=args.rpm,
+        retry_after=args.retry_after,
+        playback=args.playback,
+        upstream=args.upstream,
+        record=args.record,
+        seed=args.seed,
+    )
+    print(f"Fake Groq listening on {fake.url}", flush=True)
+    try:
+        fake._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Frame times of the animated background in each render-quality tier.
+
+The harness starts ``streamlit run app.py`` headless and opens it in
+headless Chromium once per tier (``?quality=full|reduced|static``). It then
+records the gap between animation frames for a few seconds. CPU throttling
+(``--cpu-throttle 4``, via the DevTools protocol) stands in for a low-end
+phone or kiosk. For every tier it reports frame-time percentiles, the
+average frame rate and the share of long frames. Each tier has its own
+browser context, so nothing carries over between tiers. A last run in
+``auto`` records which tier the in-page probe picks on this machine at
+this throttle.
+
+Needs Playwright, which the app itself does not::
+
+    pip install playwright && playwright install chromium
+    python -m bench.frames --cpu-throttle 4 --save-baseline bench/baselines/frames.json
+    python -m bench.frames --cpu-throttle 4 --baseline bench/baselines/frames.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+
+from assets import PROBE_SECONDS, QUALITY_TIERS
+from bench.load import RESULTS_DIR, git_commit, percentiles, start_app
+
+# 在页面里用 requestAnimationFrame 记录相邻两帧的间隔（毫秒）
+RECORD_FRAMES = """
+(duration) => new Promise((resolve) => {
+    const gaps = [];
+    let start = null;
+    let last = null;
+    const tick = (now) => {
+        if (last !== null) gaps.push(now - last);
+        last = now;
+        if (start === null) start = now;
+        if (now - start < duration) requestAnimationFrame(tick);
+        else resolve(gaps);
+    };
+    requestAnimationFrame(tick);
+})
+"""
+
+# 超过这个时长（毫秒）的帧算卡顿：60 Hz 下掉了至少一帧
+LONG_FRAME_MS = 1000 / 60 * 1.5
+
+
+def open_page(browser, url, args):
+    context = browser.new_context(
+        viewport={"width": args.width, "height": args.height}, reduced_motion="no-preference"
+    )
+    page = context.new_page()
+    if args.cpu_throttle > 1:
+        context.new_cdp_session(page).send("Emulation.setCPUThrottlingRate", {"rate": args.cpu_throttle})
+    page.goto(url, wait_until="load", timeout=args.timeout * 1000)
+    return context, page
+
+
+def measure_tier(browser, url, tier, args):
+    context, page = open_page(browser, f"{url}/?session=bench-frames-{tier}&quality={tier}", args)
+    try:
+        page.wait_for_selector(f'html[data-quality="{tier}"]', state="attached", timeout=args.timeout * 1000)
+        # 等页面和 Streamlit 的首轮渲染安静下来再开始记录
+        page.wait_for_timeout(args.settle * 1000)
+        gaps = page.evaluate(RECORD_FRAMES, args.seconds * 1000)
+    finally:
+        context.close()
+    stats = percentiles(gaps)
+    return {
+        "frame_ms": stats,
+        "fps": 1000 / stats["mean"] if stats["mean"] else None,
+        "long_frames": sum(gap > LONG_FRAME_MS for gap in gaps) / len(gaps) if gaps else None,
+    }
+
+
+def auto_tier(browser, url, args):
+    """The tier the page picks for itself in a fresh profile."""
+    context, page = open_page(browser, f"{url}/?session=bench-frames-auto", args)
+    try:
+        page.wait_for_selector("html[data-quality]", state="attached", timeout=args.timeout * 1000)
+        # 探测在加载一秒后开始，持续 PROBE_SECONDS 秒
+        page.wait_for_timeout((1 + PROBE_SECONDS + 1) * 1000)
+        return page.evaluate("document.documentElement.dataset.quality")
+    finally:
+        context.close()
+
+
+def compare(current, baseline, tolerance):
+    """Print p50/p95 frame-time changes against ``baseline``; return the number of regressions."""
+    regressions = 0
+    print(f"\nCompared with {baseline.get('commit', '?')} ({baseline.get('created', '?')}):")
+    for tier, result in current["tiers"].items():
+        old = baseline["tiers"].get(tier)
+        if old is None:
+            continue
+        for q in ("p50", "p95"):
+            before, after = old["frame_ms"][q], result["frame_ms"][q]
+            if not before or after is None:
+                continue
+            change = (after - before) / before * 100
+            flag = ""
+            if change > tolerance:
+                regressions += 1
+                flag = "  <-- regression"
+            print(f"  {tier:<8} frame {q} {before:.1f}ms -> {after:.1f}ms ({change:+.0f}%){flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Frame times of each render-quality tier in headless Chromium.")
+    parser.add_argument("--tiers", default=",".join(QUALITY_TIERS), help="comma-separated tiers (default: all)")
+    parser.add_argument("--seconds", type=float, default=5, help="how long to record each tier (default: 5)")
+    parser.add_argument("--settle", type=float, default=2, help="seconds to wait after the tier is applied")
+    parser.add_argument("--cpu-throttle", type=float, default=4, help="CPU slowdown factor, 1 for none (default: 4)")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=800)
+    parser.add_argument("--timeout", type=float, default=60, help="seconds allowed for a page to load")
+    parser.add_argument("--output", help="where to write the results JSON (default: bench/results/frames-<time>.json)")
+    parser.add_argument("--save-baseline", help="also write the results to this baseline file")
+    parser.add_argument("--baseline", help="compare with this earlier results file")
+    parser.add_argument("--tolerance", type=float, default=20, help="percent slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    try:
+        from playwright.sync_api import sync_playwright
+    except ImportError:
+        print("bench.frames needs Playwright: pip install playwright && playwright install chromium", file=sys.stderr)
+        return 2
+
+    workdir = tempfile.mkdtemp(prefix="oracle-frames-")
+    # 不问问题，所以 API 地址不会被访问
+    env = {
+        "GROQ_BASE_URL": "http://127.0.0.1:9",
+        "GROQ_API_KEY": "gsk_bench",
+        "METRICS_PORT": "0",
+        "METRICS_LOG": os.path.join(workdir, "turns.jsonl"),
+        "HISTORY_DB": os.path.join(workdir, "history.db"),
+        "STATE_DB": os.path.join(workdir, "state.db"),
+        "RENDER_QUALITY": "auto",
+    }
+    result = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "config": {
+            "cpu_throttle": args.cpu_throttle,
+            "seconds": args.seconds,
+            "viewport": [args.width, args.height],
+        },
+        "tiers": {},
+        "auto": None,
+    }
+    server, url = start_app(env)
+    try:
+        with sync_playwright() as playwright:
+            browser = playwright.chromium.launch()
+            try:
+                for tier in filter(None, args.tiers.split(",")):
+                    result["tiers"][tier] = measure_tier(browser, url, tier, args)
+                    stats = result["tiers"][tier]
+                    frames = stats["frame_ms"]
+                    print(
+                        f"{tier:<8} fps={stats['fps']:.1f} frame p50={frames['p50']:.1f}ms "
+                        f"p95={frames['p95']:.1f}ms p99={frames['p99']:.1f}ms "
+                        f"long={stats['long_frames'] * 100:.0f}% n={frames['count']}"
+                    )
+                result["auto"] = auto_tier(browser, url, args)
+                print(f"auto picks {result['auto']!r} at cpu throttle {args.cpu_throttle:g}")
+            finally:
+                browser.close()
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    output = args.output or os.path.join(RESULTS_DIR, f"frames-{datetime.now():%Y%m%d-%H%M%S}.json")
+    for path in filter(None, (output, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,435 @@
+"""Load test ``app.py`` with many concurrent sessions against the fake Groq server.
+
+The harness starts ``streamlit run app.py`` headless, pointed at the fake
+API in ``bench/fake_groq.py``. It then drives N sessions at once over
+Streamlit's websocket protocol, the same messages a browser tab sends. An
+``AppTest`` instance cannot be used from several threads at once, because
+each run swaps a process-global runtime. A session loads the page, then asks
+questions one after another, with a plain rerun after each answer. For every
+concurrency level the harness reports:
+
+* ``first_render``: the first full script run;
+* ``rerun``: a rerun without input, with the history on the page;
+* ``e2e``: a rerun that submits a question, up to the finished reading;
+* ``ttft``: time to first token, from the app's own turn log;
+* server memory per connected session and server CPU over the level.
+
+The server is restarted for every level, so each level starts cold. Results
+are printed and saved as JSON. ``--baseline`` compares a run with an earlier
+one, so results can be tracked between versions::
+
+    python -m bench.load --sessions 1,10,50 --save-baseline bench/baselines/load.json
+    python -m bench.load --sessions 1,10,50 --baseline bench/baselines/load.json
+    python -m bench.load --sessions 50,500 --latency uniform:0.2,1.5 --error-rate 0.1
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import httpx
+import websockets
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(ROOT, "bench", "results")
+
+QUESTIONS = [
+    "Will I get the job I interviewed for?",
+    "Should I tell her how I feel?",
+    "When will things get easier at work?",
+    "Is it a good time to move to a new city?",
+    "Should I invest my savings this year?",
+    "Will I pass my exam next week?",
+    "Should I forgive my friend?",
+    "我应该辞职去创业吗？",
+    "什么时候能遇到对的人？",
+    "Is my health going to improve?",
+    "Should I go back to school?",
+    "Will my family understand my choice?",
+    "今年适合买房吗？",
+    "Can I trust my new business partner?",
+    "Should I start learning the piano?",
+    "Is this relationship worth fighting for?",
+]
+
+# 报告里比较的延迟指标
+METRICS = ("first_render", "rerun", "e2e", "ttft")
+
+
+def percentiles(values):
+    """p50/p95/p99/mean of ``values`` (nearest rank, like metrics.Histogram)."""
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None, "mean": None}
+    ordered = sorted(values)
+
+    def rank(q):
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {
+        "count": len(ordered),
+        "p50": rank(0.50),
+        "p95": rank(0.95),
+        "p99": rank(0.99),
+        "mean": sum(ordered) / len(ordered),
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def process_usage(pid):
+    """``(cpu_seconds, rss_bytes)`` of a process, read from /proc; ``(None, None)`` elsewhere."""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        with open(f"/proc/{pid}/statm") as f:
+            resident = int(f.read().split()[1])
+    except OSError:
+        return None, None
+    ticks = os.sysconf("SC_CLK_TCK")
+    # utime、stime 是 stat 里 ")" 之后的第 12、13 个字段
+    return (int(fields[11]) + int(fields[12])) / ticks, resident * os.sysconf("SC_PAGE_SIZE")
+
+
+def start_fake_groq(args):
+    """Run the fake API in its own process so its CPU time is not counted as the app's."""
+    command = [
+        sys.executable, "-m", "bench.fake_groq",
+        "--port", "0",
+        "--latency", args.latency,
+        "--token-delay", args.token_delay,
+        "--error-rate", str(args.error_rate),
+        "--rpm", str(args.upstream_rpm),
+    ]
+    if args.playback:
+        command += ["--playback", args.playback]
+    if args.seed is not None:
+        command += ["--seed", str(args.seed)]
+    process = subprocess.Popen(command, cwd=ROOT, stdout=subprocess.PIPE, text=True)
+    # 等它打印出监听地址再开始
+    line = process.stdout.readline()
+    if not line.startswith("Fake Groq listening on "):
+        process.kill()
+        raise RuntimeError("fake Groq server did not start")
+    return process, line.rsplit(" ", 1)[1].strip()
+
+
+def start_app(env, timeout=60):
+    """Start ``streamlit run app.py`` headless and wait until it is healthy."""
+    port = free_port()
+    command = [
+        sys.executable, "-m", "streamlit", "run", os.path.join(ROOT, "app.py"),
+        "--server.headless", "true",
+        "--server.port", str(port),
+        "--server.fileWatcherType", "none",
+        "--browser.gatherUsageStats", "false",
+    ]
+    process = subprocess.Popen(
+        command, cwd=ROOT, env={**os.environ, **env}, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(url + "/_stcore/health", timeout=1).text.strip() == "ok":
+                return process, url
+        except httpx.HTTPError:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.2)
+    process.kill()
+    raise RuntimeError("streamlit did not start")
+
+
+def fetch_json(url):
+    try:
+        return httpx.get(url, timeout=5).json()
+    except (httpx.HTTPError, ValueError):
+        return {}
+
+
+class Session:
+    """One browser tab, speaking Streamlit's websocket protocol."""
+
+    def __init__(self, url, session_id, timeout):
+        self.ws_url = url.replace("http", "ws", 1) + "/_stcore/stream"
+        self.query = f"session={session_id}"
+        self.timeout = timeout
+        self.chat_input = None
+        self.errors = 0
+        self.ws = None
+
+    async def connect(self):
+        self.ws = await websockets.connect(self.ws_url, max_size=None, open_timeout=self.timeout)
+
+    async def close(self):
+        if self.ws is not None:
+            await self.ws.close()
+
+    async def rerun(self, question=None):
+        """Send one rerun (submitting ``question`` if given) and return its duration."""
+        message = BackMsg()
+        message.rerun_script.query_string = self.query
+        if question is not None:
+            widget_id, fragment_id = self.chat_input
+            state = WidgetState(id=widget_id)
+            state.chat_input_value.data = question
+            message.rerun_script.widget_states.widgets.append(state)
+            # 聊天区域在 fragment 里，浏览器只重跑这个 fragment
+            message.rerun_script.fragment_id = fragment_id
+        started = time.perf_counter()
+        await self.ws.send(message.SerializeToString())
+        await asyncio.wait_for(self._until_finished(), self.timeout)
+        return time.perf_counter() - started
+
+    async def _until_finished(self):
+        while True:
+            forward = ForwardMsg()
+            forward.ParseFromString(await self.ws.recv())
+            kind = forward.WhichOneof("type")
+            if kind == "delta" and forward.delta.WhichOneof("type") == "new_element":
+                element = forward.delta.new_element
+                kind = element.WhichOneof("type")
+                if kind == "chat_input":
+                    self.chat_input = (element.chat_input.id, forward.delta.fragment_id)
+                elif kind == "exception" or (kind == "alert" and element.alert.format == element.alert.ERROR):
+                    self.errors += 1
+            elif kind == "script_finished":
+                return forward.script_finished
+
+
+async def run_session(url, session_id, questions, timeout, timings):
+    session = Session(url, session_id, timeout)
+    try:
+        await session.connect()
+        timings["first_render"].append(await session.rerun())
+        for question in questions:
+            timings["e2e"].append(await session.rerun(question))
+            timings["rerun"].append(await session.rerun())
+    except Exception as e:
+        session.errors += 1
+        print(f"  session {session_id} failed: {type(e).__name__}: {e}", file=sys.stderr)
+    return session
+
+
+async def drive(url, sessions, questions_per_session, timeout, prefix):
+    questions = itertools.cycle(QUESTIONS)
+    timings = {"first_render": [], "rerun": [], "e2e": []}
+    tasks = [
+        run_session(url, f"{prefix}{i}", [next(questions) for _ in range(questions_per_session)], timeout, timings)
+        for i in range(sessions)
+    ]
+    return timings, await asyncio.gather(*tasks)
+
+
+def turn_log(path, session_prefix):
+    """Turns recorded by the app for sessions whose id starts with ``session_prefix``."""
+    turns = []
+    if not os.path.exists(path):
+        return turns
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            record = json.loads(line)
+            if str(record.get("session", "")).startswith(session_prefix):
+                turns.append(record)
+    return turns
+
+
+def run_level(sessions, args, env, log_path, upstream):
+    server, url = start_app(env)
+    try:
+        # 先加载一次页面，让导入和 cache_resource 的初始化不算进第一批会话
+        asyncio.run(drive(url, 1, 0, args.timeout, "bench-warmup-"))
+        cpu_before, rss_before = process_usage(server.pid)
+        upstream_before = fetch_json(upstream + "/stats") if upstream else {}
+
+        prefix = f"bench-{sessions}-{int(time.time())}-"
+
+        async def level():
+            timings, clients = await drive(url, sessions, args.questions, args.timeout, prefix)
+            # 所有会话仍然连着时测内存，然后再断开
+            usage = process_usage(server.pid)
+            await asyncio.gather(*(client.close() for client in clients))
+            return timings, clients, usage
+
+        started = time.perf_counter()
+        timings, clients, (cpu_after, rss_after) = asyncio.run(level())
+        wall = time.perf_counter() - started
+        upstream_after = fetch_json(upstream + "/stats") if upstream else {}
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+    turns = turn_log(log_path, prefix)
+    sources = {}
+    for turn in turns:
+        sources[turn.get("source", "none")] = sources.get(turn.get("source", "none"), 0) + 1
+    cpu = cpu_after - cpu_before if cpu_before is not None else None
+    return {
+        "sessions": sessions,
+        "questions_per_session": args.questions,
+        "wall_seconds": wall,
+        "first_render": percentiles(timings["first_render"]),
+        "rerun": percentiles(timings["rerun"]),
+        "e2e": percentiles(timings["e2e"]),
+        "ttft": percentiles([t["spans"]["ttft"] for t in turns if "ttft" in t.get("spans", {})]),
+        "memory_per_session_mb": max(rss_after - rss_before, 0) / sessions / 2**20 if rss_before else None,
+        "server_rss_mb": rss_after / 2**20 if rss_after else None,
+        "server_cpu_seconds": cpu,
+        "server_cpu_percent": 100 * cpu / wall if cpu is not None and wall else None,
+        "errors": sum(client.errors for client in clients) + sum(1 for t in turns if t.get("error")),
+        "sources": sources,
+        "upstream": {key: value - upstream_before.get(key, 0) for key, value in upstream_after.items()},
+    }
+
+
+def print_level(level):
+    cpu = level["server_cpu_percent"]
+    memory = level["memory_per_session_mb"]
+    print(
+        f"sessions={level['sessions']:<4} wall={level['wall_seconds']:.1f}s "
+        f"cpu={'-' if cpu is None else f'{cpu:.0f}%'} "
+        f"mem/session={'-' if memory is None else f'{memory:.2f}MB'} "
+        f"errors={level['errors']} sources={level['sources']} upstream={level['upstream']}"
+    )
+    for name in METRICS:
+        stats = level[name]
+        if stats["count"]:
+            print(f"    {name:<13} p50={stats['p50']:.3f}s p95={stats['p95']:.3f}s p99={stats['p99']:.3f}s n={stats['count']}")
+
+
+def compare(current, baseline, tolerance):
+    """Print p50/p99 changes against ``baseline``; return the number of regressions."""
+    previous = {level["sessions"]: level for level in baseline["levels"]}
+    regressions = 0
+    print(f"\nCompared with {baseline.get('commit', '?')} ({baseline.get('created', '?')}):")
+    for level in current["levels"]:
+        old = previous.get(level["sessions"])
+        if old is None:
+            continue
+        for name in METRICS:
+            for q in ("p50", "p99"):
+                before, after = old[name][q], level[name][q]
+                if not before or after is None:
+                    continue
+                change = (after - before) / before * 100
+                flag = ""
+                if change > tolerance:
+                    regressions += 1
+                    flag = "  <-- regression"
+                print(f"  sessions={level['sessions']:<4} {name:<13} {q} {before:.3f}s -> {after:.3f}s ({change:+.0f}%){flag}")
+    return regressions
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent-session load test for the Streamlit app.")
+    parser.add_argument("--sessions", default="1,10,50", help="comma-separated concurrency levels (default: 1,10,50)")
+    parser.add_argument("--questions", type=int, default=3, help="questions asked by each session (default: 3)")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds allowed for one rerun")
+    parser.add_argument("--base-url", help="use an already running API instead of starting the fake server")
+    parser.add_argument("--latency", default="lognormal:0.4,0.5", help="fake time to first token")
+    parser.add_argument("--token-delay", default="fixed:0.02", help="fake gap between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of fake responses that are 429s")
+    parser.add_argument("--upstream-rpm", type=int, default=0, help="fake API requests-per-minute limit (0: none)")
+    parser.add_argument("--playback", help="JSONL of recorded responses for the fake server to replay")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument(
+        "--app-env", action="append", default=[], metavar="NAME=VALUE",
+        help="extra app setting, e.g. PROMPT_MODE=full or BATCH_ENABLED=true (repeatable)",
+    )
+    parser.add_argument("--output", help="where to write the results JSON (default: bench/results/load-<time>.json)")
+    parser.add_argument("--save-baseline", help="also write the results to this baseline file")
+    parser.add_argument("--baseline", help="compare with this earlier results file")
+    parser.add_argument("--tolerance", type=float, default=20, help="percent slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    levels = [int(n) for n in args.sessions.split(",") if n.strip()]
+    workdir = tempfile.mkdtemp(prefix="oracle-bench-")
+    log_path = os.path.join(workdir, "turns.jsonl")
+    fake = None
+    if args.base_url:
+        base_url = args.base_url
+    else:
+        fake, base_url = start_fake_groq(args)
+
+    # 配额放宽、关闭防抖：测的是应用本身，而不是排队
+    env = {
+        "GROQ_BASE_URL": base_url,
+        "GROQ_API_KEY": os.environ.get("GROQ_API_KEY", "gsk_bench"),
+        "GROQ_RPM": "100000",
+        "GROQ_TPM": "100000000",
+        "QUEUE_MAX": "100000",
+        "DEBOUNCE_SECONDS": "0",
+        "HISTORY_DB": os.path.join(workdir, "history.db"),
+        "STATE_DB": os.path.join(workdir, "state.db"),
+        "METRICS_LOG": log_path,
+        "METRICS_PORT": "0",
+    }
+    for item in args.app_env:
+        name, _, value = item.partition("=")
+        env[name] = value
+
+    run = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": {
+            "latency": args.latency,
+            "token_delay": args.token_delay,
+            "error_rate": args.error_rate,
+            "upstream_rpm": args.upstream_rpm,
+            "playback": args.playback,
+            "questions_per_session": args.questions,
+            "app_env": args.app_env,
+        },
+        "levels": [],
+    }
+    try:
+        for sessions in levels:
+            level = run_level(sessions, args, env, log_path, None if args.base_url else base_url)
+            run["levels"].append(level)
+            print_level(level)
+    finally:
+        if fake is not None:
+            fake.terminate()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"load-{datetime.now():%Y%m%d-%H%M%S}.json")
+    for path in filter(None, (output, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(run, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(run, json.load(f), args.tolerance)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""Cold-start benchmark for ``app.py``: import time and time to first render.
+
+Two things are measured, each over several fresh processes:
+
+* ``imports``: ``python -X importtime`` on the modules ``app.py`` imports,
+  on top of an already imported Streamlit (the server has loaded it before
+  the script first runs). Modules that the app defers until the first
+  question (the ``groq`` SDK) must not show up here at all.
+* ``server_ready``: ``streamlit run app.py`` until ``/_stcore/health`` answers;
+  ``first_render``: the first page load on a fresh server, which pays for the
+  app's imports and every ``st.cache_resource`` it needs before the page
+  shows up; ``second_render``: the next page load, with those already cached.
+
+No question is asked, so no API is needed. Results are saved as JSON and
+can be compared with a baseline, like ``bench/load.py``::
+
+    python -m bench.startup --runs 5 --save-baseline bench/baselines/startup.json
+    python -m bench.startup --runs 5 --baseline bench/baselines/startup.json
+"""
+
+import argparse
+import ast
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from bench.load import RESULTS_DIR, ROOT, Session, git_commit, percentiles, start_app
+
+# 这些模块应该推迟到第一个问题时才导入，出现在启动阶段就算回归
+DEFERRED_MODULES = ("groq",)
+
+METRICS = ("imports", "server_ready", "first_render", "second_render")
+
+
+def app_imports():
+    """Top-level modules imported by ``app.py``, in order, without Streamlit itself."""
+    with open(os.path.join(ROOT, "app.py"), encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            modules.append(node.module)
+    return [module for module in modules if module.split(".")[0] != "streamlit"]
+
+
+def parse_importtime(output):
+    """``(name, depth, cumulative_seconds)`` for each line of ``-X importtime`` output."""
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            # 表头那一行
+            continue
+        # 名字前有一个空格，每深一层再多缩进两格
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((name.strip(), depth, int(cumulative) / 1e6))
+    return entries
+
+
+def measure_imports(modules):
+    """Seconds spent importing ``modules`` after Streamlit, per module, and every module loaded."""
+    code = "import streamlit\n" + "".join(f"import {module}\n" for module in modules)
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+    )
+    entries = parse_importtime(result.stderr)
+    # 跳过 streamlit 本身带进来的模块，只看应用自己的导入
+    start = next(i for i, (name, depth, _) in enumerate(entries) if name == "streamlit" and depth == 0) + 1
+    after = entries[start:]
+    top = {name: seconds for name, depth, seconds in after if depth == 0}
+    return top, {name for name, _, _ in after}
+
+
+async def page_load(url, session_id, timeout):
+    session = Session(url, session_id, timeout)
+    await session.connect()
+    try:
+        return await session.rerun(), session.errors
+    finally:
+        await session.close()
+
+
+def measure_render(env, timeout):
+    """``(server_ready, first_render, second_render, errors)`` for one fresh server."""
+    started = time.perf_counter()
+    server, url = start_app(env)
+    ready = time.perf_counter() - started
+    try:
+        first, first_errors = asyncio.run(page_load(url, "startup-1", timeout))
+        second, second_errors = asyncio.run(page_load(url, "startup-2", timeout))
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+    return ready, first, second, first_errors + second_errors
+
+
+def compare(current, baseline, tolerance):
+    """Print p50 changes against ``baseline``; return the number of regressions."""
+    regressions = 0
+    print(f"\nCompared with {baseline.get('commit', '?')} ({baseline.get('created', '?')}):")
+    for name in METRICS:
+        before, after = baseline["metrics"].get(name, {}).get("p50"), current["metrics"][name]["p50"]
+        if not before or after is None:
+            continue
+        change = (after - before) / before * 100
+        flag = ""
+        if change > tolerance:
+            regressions += 1
+            flag = "  <-- regression"
+        print(f"  {name:<13} p50 {before:.3f}s -> {after:.3f}s ({change:+.0f}%){flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import time and time-to-first-render of the Streamlit app.")
+    parser.add_argument("--runs", type=int, default=5, help="fresh processes per measurement (default: 5)")
+    parser.add_argument("--timeout", type=float, default=60, help="seconds allowed for one page load")
+    parser.add_argument(
+        "--app-env", action="append", default=[], metavar="NAME=VALUE",
+        help="extra app setting, e.g. READING_MODE=pooled (repeatable)",
+    )
+    parser.add_argument("--output", help="where to write the results JSON (default: bench/results/startup-<time>.json)")
+    parser.add_argument("--save-baseline", help="also write the results to this baseline file")
+    parser.add_argument("--baseline", help="compare with this earlier results file")
+    parser.add_argument("--tolerance", type=float, default=20, help="percent slowdown counted as a regression")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="oracle-startup-")
+    # 不问问题，所以 API 地址不会被访问；数据库放在临时目录，每次都是冷启动
+    env = {
+        "GROQ_BASE_URL": "http://127.0.0.1:9",
+        "GROQ_API_KEY": "gsk_bench",
+        "METRICS_PORT": "0",
+        "METRICS_LOG": os.path.join(workdir, "turns.jsonl"),
+    }
+    for item in args.app_env:
+        name, _, value = item.partition("=")
+        env[name] = value
+
+    modules = app_imports()
+    timings = {name: [] for name in METRICS}
+    per_module = {module: [] for module in modules}
+    deferred = set()
+    errors = 0
+    for run in range(args.runs):
+        top, loaded = measure_imports(modules)
+        timings["imports"].append(sum(top.values()))
+        for module in modules:
+            per_module[module].append(top.get(module, 0.0))
+        deferred |= {name.split(".")[0] for name in loaded} & set(DEFERRED_MODULES)
+
+        run_env = dict(
+            env,
+            HISTORY_DB=os.path.join(workdir, f"history-{run}.db"),
+            STATE_DB=os.path.join(workdir, f"state-{run}.db"),
+        )
+        ready, first, second, run_errors = measure_render(run_env, args.timeout)
+        timings["server_ready"].append(ready)
+        timings["first_render"].append(first)
+        timings["second_render"].append(second)
+        errors += run_errors
+
+    result = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "commit": git_commit(),
+        "python": sys.version.split()[0],
+        "config": {"runs": args.runs, "app_env": args.app_env},
+        "metrics": {name: percentiles(values) for name, values in timings.items()},
+        "modules": {module: percentiles(values)["p50"] for module, values in per_module.items()},
+        "deferred_imported": sorted(deferred),
+        "errors": errors,
+    }
+
+    for name in METRICS:
+        stats = result["metrics"][name]
+        print(f"{name:<13} p50={stats['p50']:.3f}s p95={stats['p95']:.3f}s n={stats['count']}")
+    slowest = sorted(result["modules"].items(), key=lambda item: -item[1])[:5]
+    print("slowest imports: " + ", ".join(f"{module}={seconds * 1000:.0f}ms" for module, seconds in slowest))
+    if deferred:
+        print(f"imported at startup but meant to be deferred: {', '.join(sorted(deferred))}")
+    if errors:
+        print(f"{errors} page loads showed an error")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"startup-{datetime.now():%Y%m%d-%H%M%S}.json")
+    for path in filter(None, (output, args.save_baseline)):
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+    print(f"\nResults written to {output}")
+
+    failed = bool(deferred or errors)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failed |= compare(result, json.load(f), args.tolerance) > 0
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
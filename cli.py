@@ -0,0 +1,139 @@
+"""Generate oracle readings in bulk, without a browser.
+
+Questions come from a file or stdin, one per line. A line can be plain
+text or a JSON object ``{"id": ..., "question": ...}``. Readings are written
+as JSONL in the order they complete, one line per question, flushed
+as they go. With ``--resume`` an existing output file is read first, and
+questions that already have a successful line are skipped. An interrupted
+run can then be restarted with the same command.
+
+    python cli.py questions.txt -o readings.jsonl --concurrency 8 --resume
+    echo "Will it rain tomorrow?" | python cli.py -
+
+Options such as ``GROQ_API_KEY``, ``PROMPT_MODE`` or ``GROQ_RPM`` come from the
+environment (see :class:`pipeline.Settings`).
+"""
+
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from pipeline import OraclePipeline, Settings
+
+
+def read_questions(lines):
+    """Yield ``(id, question)`` pairs; plain lines are numbered from 1."""
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        if line.startswith("{"):
+            entry = json.loads(line)
+            yield str(entry.get("id", number)), entry["question"]
+        else:
+            yield str(number), line
+
+
+def finished_ids(path):
+    """Ids that already have a successful reading in ``path``."""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 上次中断时可能只写了半行
+                continue
+            if "error" not in record:
+                done.add(record["id"])
+    return done
+
+
+def run(pipeline, questions, out, concurrency=4):
+    """Interpret ``questions`` with at most ``concurrency`` in flight, writing JSONL to ``out``.
+
+    Returns ``(written, failed)``.
+    """
+
+    def interpret(question_id, question):
+        try:
+            reading = pipeline.interpret(question, session_id=f"cli:{question_id}")
+        except Exception as e:
+            return {"id": question_id, "question": question, "error": f"{type(e).__name__}: {e}"}
+        return {
+            "id": question_id,
+            "question": question,
+            "answer": reading.answer.text,
+            "category": reading.answer.category,
+            "report": reading.report,
+            "source": reading.source,
+            "prompt_tokens": reading.prompt_tokens,
+            "completion_tokens": reading.completion_tokens,
+            "seconds": round(reading.seconds, 3),
+        }
+
+    written = failed = 0
+    questions = iter(questions)
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="oracle-cli") as executor:
+        # 只保留 concurrency 个任务在途，输入可以是很长的流
+        pending = set()
+        while True:
+            for question_id, question in questions:
+                pending.add(executor.submit(interpret, question_id, question))
+                if len(pending) >= concurrency:
+                    break
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                written += 1
+                failed += "error" in record
+    return written, failed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate Book of Answers readings as JSONL.")
+    parser.add_argument("input", help="questions file, one per line (plain text or JSON), or - for stdin")
+    parser.add_argument("-o", "--output", help="JSONL output file (default: stdout)")
+    parser.add_argument("-c", "--concurrency", type=int, default=4, help="readings in flight at once (default: 4)")
+    parser.add_argument("--resume", action="store_true", help="skip ids already written to --output without an error")
+    args = parser.parse_args(argv)
+    if args.resume and not args.output:
+        parser.error("--resume needs --output")
+
+    source = sys.stdin if args.input == "-" else open(args.input, encoding="utf-8")
+    skip = finished_ids(args.output) if args.resume else set()
+    questions = ((qid, q) for qid, q in read_questions(source) if qid not in skip)
+    out = open(args.output, "a" if args.resume else "w", encoding="utf-8") if args.output else sys.stdout
+    if args.resume and out.tell() > 0:
+        with open(args.output, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                # 补上被中断的半行的换行，新记录从新的一行开始
+                out.write("\n")
+
+    pipeline = OraclePipeline(Settings.load())
+    try:
+        written, failed = run(pipeline, questions, out, concurrency=max(1, args.concurrency))
+    except KeyboardInterrupt:
+        print("Interrupted; rerun with --resume to continue.", file=sys.stderr)
+        return 130
+    finally:
+        pipeline.close()
+        if out is not sys.stdout:
+            out.close()
+        if source is not sys.stdin:
+            source.close()
+    print(f"{written} readings written ({failed} failed, {len(skip)} skipped).", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
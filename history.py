@@ -0,0 +1,195 @@
+"""Bounded chat history backed by a local SQLite transcript store.
+
+Every message is written to SQLite, so conversations survive a server
+restart. The database runs in WAL mode, so several worker processes can
+share one file. In memory, each session only keeps a small window of its latest
+messages (capped by count and by size). That window is all the app renders
+on a rerun, and older messages are paged in from SQLite on demand. Sessions
+that stay idle are dropped from memory and reloaded from disk if they come
+back.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    meta TEXT NOT NULL DEFAULT '{}',
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_session ON messages (session_id, id);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    last_seen REAL NOT NULL
+);
+"""
+
+
+class HistoryStore:
+    """Append-only transcript store, safe to share between threads."""
+
+    def __init__(self, path):
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        # WAL：其他进程写入时读不会被挡住
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.executescript(SCHEMA)
+
+    def append(self, session_id, message):
+        """Persist one message dict and return its row id."""
+        meta = {k: v for k, v in message.items() if k not in ("role", "content")}
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO messages (session_id, role, content, meta, created_at) VALUES (?, ?, ?, ?, ?)",
+                (session_id, message["role"], message["content"], json.dumps(meta), now),
+            )
+            self._conn.execute(
+                "INSERT INTO sessions (session_id, last_seen) VALUES (?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET last_seen = excluded.last_seen",
+                (session_id, now),
+            )
+            return cursor.lastrowid
+
+    def page(self, session_id, before_id=None, limit=20):
+        """Up to ``limit`` messages older than ``before_id``, oldest first."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, role, content, meta FROM messages WHERE session_id = ? AND id < ? "
+                "ORDER BY id DESC LIMIT ?",
+                (session_id, before_id if before_id is not None else 2 ** 63 - 1, limit),
+            ).fetchall()
+        return [
+            {"id": row["id"], "role": row["role"], "content": row["content"], **json.loads(row["meta"])}
+            for row in reversed(rows)
+        ]
+
+    def latest_id(self, session_id):
+        """Row id of the session's newest message, or ``None``."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT MAX(id) FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()
+        return row[0]
+
+    def has_before(self, session_id, before_id):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM messages WHERE session_id = ? AND id < ? LIMIT 1",
+                (session_id, before_id),
+            ).fetchone()
+        return row is not None
+
+    def prune(self, max_age_seconds):
+        """Delete transcripts of sessions not seen for ``max_age_seconds``."""
+        cutoff = time.time() - max_age_seconds
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM messages WHERE session_id IN (SELECT session_id FROM sessions WHERE last_seen < ?)",
+                (cutoff,),
+            )
+            self._conn.execute("DELETE FROM sessions WHERE last_seen < ?", (cutoff,))
+
+
+class SessionHistory:
+    """The in-memory window of one session's latest messages."""
+
+    def __init__(self, session_id, store, window=20, max_bytes=64 * 1024):
+        self.session_id = session_id
+        self.store = store
+        self.max_bytes = max_bytes
+        self.messages = deque(store.page(session_id, limit=window), maxlen=window)
+        self.last_seen = time.monotonic()
+        self._trim()
+
+    def refresh(self):
+        """Reload the window if another process has appended to this session since."""
+        newest = self.messages[-1]["id"] if self.messages else None
+        if self.store.latest_id(self.session_id) != newest:
+            window = self.messages.maxlen
+            self.messages = deque(self.store.page(self.session_id, limit=window), maxlen=window)
+            self._trim()
+
+    def append(self, message):
+        message = dict(message, id=self.store.append(self.session_id, message))
+        self.messages.append(message)
+        self._trim()
+        return message
+
+    @property
+    def oldest_id(self):
+        return self.messages[0]["id"] if self.messages else None
+
+    def has_older(self, before_id=None):
+        before_id = before_id if before_id is not None else self.oldest_id
+        return before_id is not None and self.store.has_before(self.session_id, before_id)
+
+    def older(self, pages, page_size=20):
+        """Messages just before the in-memory window, read from disk, not kept in memory."""
+        if self.oldest_id is None or pages <= 0:
+            return []
+        return self.store.page(self.session_id, before_id=self.oldest_id, limit=pages * page_size)
+
+    def _trim(self):
+        size = sum(len(message["content"].encode("utf-8")) for message in self.messages)
+        # 至少保留最近一问一答
+        while size > self.max_bytes and len(self.messages) > 2:
+            size -= len(self.messages.popleft()["content"].encode("utf-8"))
+
+
+class SessionRegistry:
+    """Process-wide map of session windows with idle eviction."""
+
+    def __init__(self, store, window=20, max_bytes=64 * 1024, idle_seconds=1800, max_sessions=1000, shared=False):
+        self.store = store
+        # 多个 worker 共用同一个库时，每次取窗口前先确认没有别的进程写过
+        self.shared = shared
+        self.window = window
+        self.max_bytes = max_bytes
+        self.idle_seconds = idle_seconds
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = time.monotonic()
+        self.evicted = 0
+
+    def get(self, session_id):
+        now = time.monotonic()
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None:
+                history = SessionHistory(session_id, self.store, self.window, self.max_bytes)
+                self._sessions[session_id] = history
+            elif self.shared:
+                history.refresh()
+            self._sessions.move_to_end(session_id)
+            history.last_seen = now
+            if now - self._last_sweep > 60:
+                self._sweep(now)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted += 1
+        return history
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "messages": sum(len(h.messages) for h in self._sessions.values()),
+                "evicted": self.evicted,
+            }
+
+    def _sweep(self, now):
+        self._last_sweep = now
+        for session_id in [s for s, h in self._sessions.items() if now - h.last_seen > self.idle_seconds]:
+            del self._sessions[session_id]
+            self.evicted += 1
@@ -0,0 +1,229 @@
+"""Shared interpretation cache for the Book of Answers.
+
+Interpretations are keyed on a normalized question plus the drawn book
+answer. Only the interpretation sentences are stored, not the rendered
+report, so a hit can be put back into the frame with the new wording.
+Entries expire after a TTL and the least recently used ones are evicted
+once the cache is full. Questions that are worded slightly differently
+("will I get the job" / "Will I get this job?") still hit through a
+MinHash/LSH index over character bigrams. Bigrams alone also rate "will I
+get the job" and "will I lose the job" as close, so a near hit must also
+have the same content words (see :func:`same_words`).
+"""
+
+import hashlib
+import random
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass
+
+# MinHash 参数：64 个哈希，分成 16 段、每段 4 行做 LSH 分桶
+MINHASH_PERMUTATIONS = 64
+LSH_BANDS = 16
+NGRAM_SIZE = 2
+_MERSENNE_PRIME = (1 << 61) - 1
+_rng = random.Random(1337)
+_PERMUTATIONS = [
+    (_rng.randrange(1, _MERSENNE_PRIME), _rng.randrange(0, _MERSENNE_PRIME))
+    for _ in range(MINHASH_PERMUTATIONS)
+]
+
+_PUNCTUATION = re.compile(r"[^\w\s]", re.UNICODE)
+_WHITESPACE = re.compile(r"\s+")
+# 中日文没有空格，每个汉字算一个词
+_WORD = re.compile(r"[\u3040-\u30ff\u3400-\u9fff]|[^\s\u3040-\u30ff\u3400-\u9fff]+")
+# 换掉这些词不改变问的是什么
+STOP_WORDS = frozenset(
+    "a an the this that these those my your his her our their me it its is are am be do does to of for in on at".split()
+)
+
+
+def normalize_question(question):
+    """Lower-case, strip punctuation and collapse whitespace."""
+    text = unicodedata.normalize("NFKC", question).casefold()
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def ngrams(text, n=NGRAM_SIZE):
+    """Set of character n-grams of an already normalized question."""
+    if len(text) <= n:
+        return {text} if text else set()
+    return {text[i:i + n] for i in range(len(text) - n + 1)}
+
+
+def minhash(grams):
+    """MinHash signature of a set of n-grams."""
+    hashes = [
+        int.from_bytes(hashlib.blake2b(gram.encode("utf-8"), digest_size=8).digest(), "big")
+        for gram in grams
+    ]
+    if not hashes:
+        return (0,) * MINHASH_PERMUTATIONS
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def lsh_bands(signature):
+    """Split a signature into hashable LSH band keys."""
+    rows = MINHASH_PERMUTATIONS // LSH_BANDS
+    return [(band, signature[band * rows:(band + 1) * rows]) for band in range(LSH_BANDS)]
+
+
+def jaccard(left, right):
+    if not left or not right:
+        return 0.0
+    return len(left & right) / len(left | right)
+
+
+def content_words(normalized):
+    """Words of an already normalized question, without :data:`STOP_WORDS`."""
+    return {word for word in _WORD.findall(normalized) if word not in STOP_WORDS}
+
+
+def _same_word(word, others):
+    if word in others:
+        return True
+    # 单复数、拼写错一个字母之类的小差别（只看三个字母以上的词）
+    grams = ngrams(word)
+    return len(word) >= 3 and any(len(other) >= 3 and jaccard(grams, ngrams(other)) >= 0.5 for other in others)
+
+
+def same_words(left, right):
+    """Whether two normalized questions use the same content words, up to small spelling changes.
+
+    >>> same_words("will i get the job", "will i get this job")
+    True
+    >>> same_words("will i get the job", "will i get the jobs")
+    True
+    >>> same_words("will i get the job", "will i lose the job")
+    False
+    >>> same_words("should i stay", "should i leave")
+    False
+    >>> same_words("我会得到这份工作吗", "我会失去这份工作吗")
+    False
+    """
+    left_words, right_words = content_words(left), content_words(right)
+    return all(_same_word(word, right_words) for word in left_words) and all(
+        _same_word(word, left_words) for word in right_words
+    )
+
+
+@dataclass
+class CacheEntry:
+    question: str
+    answer: str
+    interpretation: str
+    grams: frozenset
+    bands: list
+    expires_at: float
+
+
+class InterpretationCache:
+    """Thread-safe LRU + TTL cache with near-duplicate lookup.
+
+    LSH only proposes candidates that share a band with the question; a
+    candidate counts as the same question when the Jaccard similarity of
+    the bigram sets is at least ``min_similarity`` and :func:`same_words`
+    agrees.
+    """
+
+    def __init__(self, max_entries=2048, ttl_seconds=24 * 3600, min_similarity=0.6):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+        self._entries = OrderedDict()
+        # (answer, band, band_value) -> set of keys
+        self._index = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(question, answer):
+        return normalize_question(question), answer
+
+    def get(self, question, answer):
+        """Return the cached entry for this question/answer, or ``None``."""
+        key = self.make_key(question, answer)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            if entry is not None:
+                self._remove(key)
+
+            entry = self._nearest(key[0], answer, now)
+            if entry is not None:
+                self.near_hits += 1
+                return entry
+            self.misses += 1
+            return None
+
+    def put(self, question, answer, interpretation):
+        key = self.make_key(question, answer)
+        grams = frozenset(ngrams(key[0]))
+        bands = lsh_bands(minhash(grams))
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = CacheEntry(
+                question=question,
+                answer=answer,
+                interpretation=interpretation,
+                grams=grams,
+                bands=bands,
+                expires_at=time.monotonic() + self.ttl_seconds,
+            )
+            for band in bands:
+                self._index.setdefault((answer, *band), set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            }
+
+    def _nearest(self, normalized, answer, now):
+        grams = ngrams(normalized)
+        candidates = set()
+        for band in lsh_bands(minhash(grams)):
+            candidates |= self._index.get((answer, *band), set())
+
+        best_key, best_similarity = None, self.min_similarity
+        for key in candidates:
+            entry = self._entries[key]
+            if entry.expires_at <= now:
+                continue
+            similarity = jaccard(grams, entry.grams)
+            if similarity >= best_similarity and same_words(normalized, key[0]):
+                best_key, best_similarity = key, similarity
+        if best_key is None:
+            return None
+        self._entries.move_to_end(best_key)
+        return self._entries[best_key]
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        for band in entry.bands:
+            bucket = self._index.get((entry.answer, *band))
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._index[(entry.answer, *band)]
@@ -0,0 +1,351 @@
+"""Process-wide Groq client with deadlines, retries, hedging and a circuit breaker.
+
+Streamlit reruns the whole script for every interaction, so the client lives
+behind ``st.cache_resource`` and is shared by all sessions. One pooled
+``httpx.Client`` keeps connections to Groq alive across reruns.
+
+Every call gets an overall deadline. 429s, 5xx errors, timeouts and
+connection errors are retried with full-jitter exponential backoff. With
+hedging on, a second request is fired once the primary has been quiet for
+longer than the observed p95 latency of the same kind of call to the same
+model (time to first chunk for streams, whole completions otherwise),
+optionally against a faster model, and
+whichever answers first wins. The hedge is an extra call on the account's
+quota, so it only fires when ``hedge_budget`` grants it; the losing attempt
+stops retrying. After too many consecutive failures the circuit breaker
+opens and calls fail fast until Groq has had time to recover.
+
+The ``groq`` SDK (and httpx and pydantic behind it) is only imported when
+the first :class:`LLMClient` is built, not when this module is. The page can
+then render before any of it is loaded, and the first question pays for it.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+
+class CircuitOpenError(Exception):
+    """Raised without calling Groq while the circuit breaker is open."""
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a call runs out of time before any attempt succeeds."""
+
+
+class HedgeLostError(Exception):
+    """Raised instead of retrying once the other hedged attempt has already answered."""
+
+
+class CircuitBreaker:
+    """Closed -> open after ``failure_threshold`` consecutive failures.
+
+    Once ``reset_timeout`` seconds have passed, a single trial call is let
+    through (half-open). Its success closes the circuit again and its failure
+    re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_in_flight or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_in_flight = False
+
+
+class LatencyTracker:
+    """Rolling window of call latencies used to pick the hedging delay."""
+
+    def __init__(self, window=200, min_samples=20, default=2.0):
+        self.min_samples = min_samples
+        self.default = default
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return self.default
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+
+class LLMClient:
+    def __init__(
+        self,
+        api_key,
+        timeout=20.0,
+        connect_timeout=5.0,
+        max_retries=3,
+        backoff_base=0.5,
+        backoff_cap=8.0,
+        hedge=False,
+        hedge_model=None,
+        hedge_quantile=0.95,
+        hedge_budget=None,
+        max_connections=20,
+        keepalive_seconds=30.0,
+        breaker=None,
+    ):
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.hedge = hedge
+        self.hedge_model = hedge_model
+        self.hedge_quantile = hedge_quantile
+        # hedge_budget(messages, max_tokens) 为对冲请求扣配额，返回 False 就不对冲
+        self.hedge_budget = hedge_budget
+        self.breaker = breaker or CircuitBreaker()
+        # (kind, model) -> LatencyTracker；kind 是 "ttft"（流式的首块）或 "completion"（整次调用）
+        self._latency = {}
+        self._latency_lock = threading.Lock()
+
+        # 导入 groq 要几百毫秒，推迟到第一次真正需要客户端时
+        import groq
+        import httpx
+
+        self._retryable_errors = (
+            groq.RateLimitError,
+            groq.InternalServerError,
+            groq.APITimeoutError,
+            groq.APIConnectionError,
+        )
+        self._status_error = groq.APIStatusError
+        self._http = httpx.Client(
+            timeout=httpx.Timeout(timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                # 空闲连接多保留一会儿，预热的连接在用户打字期间不会被关掉
+                keepalive_expiry=keepalive_seconds,
+            ),
+        )
+        # 重试由本层负责，SDK 自带的重试关掉
+        self._groq = groq.Groq(api_key=api_key, http_client=self._http, max_retries=0)
+        self._executor = ThreadPoolExecutor(max_workers=2 * max_connections, thread_name_prefix="llm-hedge")
+        self.hedges_fired = 0
+        self.hedges_won = 0
+        self.hedges_skipped = 0
+
+    def create(self, messages, model, deadline=None, **kwargs):
+        """Blocking chat completion; returns the SDK's ``ChatCompletion``."""
+        deadline = time.monotonic() + (deadline or self.timeout)
+
+        def attempt(attempt_model, lost=None):
+            return self._with_retries(
+                lambda timeout: self._groq.chat.completions.create(
+                    messages=messages, model=attempt_model, timeout=timeout, **kwargs
+                ),
+                deadline,
+                self.latency("completion", attempt_model),
+                lost,
+            )
+
+        return self._hedged(attempt, "completion", model, deadline, (messages, kwargs.get("max_tokens", 0)))
+
+    def stream(self, messages, model, deadline=None, **kwargs):
+        """Streaming chat completion; yields the SDK's chunk objects.
+
+        Retries and hedging only cover the wait for the first chunk. A stream
+        that breaks halfway through raises to the caller.
+        """
+        deadline = time.monotonic() + (deadline or self.timeout)
+
+        def attempt(attempt_model, lost=None):
+            def open_stream(timeout):
+                stream = self._groq.chat.completions.create(
+                    messages=messages, model=attempt_model, timeout=timeout, stream=True, **kwargs
+                )
+                chunks = iter(stream)
+                try:
+                    first = next(chunks)
+                except StopIteration:
+                    first = None
+                except BaseException:
+                    stream.close()
+                    raise
+                return stream, chunks, first
+
+            return self._with_retries(open_stream, deadline, self.latency("ttft", attempt_model), lost)
+
+        stream, chunks, first = self._hedged(
+            attempt, "ttft", model, deadline, (messages, kwargs.get("max_tokens", 0)), discard=lambda opened: opened[0].close()
+        )
+        return self._resume(stream, chunks, first)
+
+    def warm_up(self):
+        """Open a pooled connection to the API host ahead of the first call.
+
+        Only a bare ``HEAD`` request goes out, without the API key, so it
+        does not count against any quota. Failures are ignored; the real call
+        will retry and report them.
+        """
+        try:
+            self._http.head(str(self._groq.base_url), timeout=5.0)
+        except Exception:
+            pass
+
+    def latency(self, kind, model):
+        """The latency tracker for one kind of call (``ttft`` or ``completion``) to ``model``."""
+        with self._latency_lock:
+            return self._latency.setdefault((kind, model), LatencyTracker())
+
+    def stats(self):
+        stats = {"circuit": self.breaker.state}
+        with self._latency_lock:
+            trackers = dict(self._latency)
+        for kind in ("ttft", "completion"):
+            # 指标只报主模型的（样本最多的那个），对冲模型的另算
+            own = [t for (k, model), t in trackers.items() if k == kind and model != self.hedge_model]
+            if own:
+                tracker = max(own, key=len)
+                stats[f"{kind}_p50"] = tracker.percentile(0.50)
+                stats[f"{kind}_p95"] = tracker.percentile(0.95)
+        return {
+            **stats,
+            "hedges_fired": self.hedges_fired,
+            "hedges_won": self.hedges_won,
+            "hedges_skipped": self.hedges_skipped,
+        }
+
+    @staticmethod
+    def _resume(stream, chunks, first):
+        try:
+            if first is not None:
+                yield first
+            yield from chunks
+        finally:
+            stream.close()
+
+    def _hedged(self, attempt, kind, model, deadline, cost, discard=None):
+        if not self.hedge:
+            return attempt(model)
+
+        hedge_after = self.latency(kind, model).percentile(self.hedge_quantile)
+        # 一方先成功后，另一方不再重试
+        lost = threading.Event()
+        primary = self._executor.submit(attempt, model, lost)
+        done, _ = wait([primary], timeout=min(hedge_after, max(deadline - time.monotonic(), 0)))
+        if done:
+            return primary.result()
+        if self.hedge_budget is not None and not self.hedge_budget(*cost):
+            # 配额不够富余：不发对冲请求，只等主请求
+            self.hedges_skipped += 1
+            return primary.result()
+
+        self.hedges_fired += 1
+        backup = self._executor.submit(attempt, self.hedge_model or model, lost)
+        pending = {primary, backup}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is not None:
+                    error = error or future.exception()
+                    continue
+                if future is backup:
+                    self.hedges_won += 1
+                lost.set()
+                # 输掉的请求在后台结束后关闭，不阻塞当前用户
+                for loser in pending:
+                    loser.add_done_callback(lambda f: self._discard(f, discard))
+                return future.result()
+        raise error
+
+    @staticmethod
+    def _discard(future, discard):
+        if discard is not None and not future.cancelled() and future.exception() is None:
+            discard(future.result())
+
+    def _with_retries(self, call, deadline, latency, lost=None):
+        for retry in range(self.max_retries + 1):
+            # 先做不调用 Groq 的检查，再向熔断器要名额：半开时 allow() 会占用唯一的试探名额
+            if lost is not None and lost.is_set():
+                raise HedgeLostError("The other hedged attempt already answered")
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                raise DeadlineExceeded("LLM call deadline exceeded")
+            if not self.breaker.allow():
+                raise CircuitOpenError("Groq is failing; circuit breaker is open")
+
+            started = time.monotonic()
+            succeeded = False
+            try:
+                result = call(min(self.timeout, remaining))
+                succeeded = True
+            except self._retryable_errors as e:
+                if retry == self.max_retries:
+                    raise
+                delay = self._backoff(retry, e)
+                if time.monotonic() + delay >= deadline:
+                    raise
+                error_delay = delay
+            except self._status_error:
+                # 4xx（除 429 外）是请求本身的问题，不算 Groq 故障
+                succeeded = True
+                raise
+            finally:
+                # 每次调用都要记下结果，包括被打断的（比如 KeyboardInterrupt），否则半开的试探名额永远不会释放
+                if succeeded:
+                    self.breaker.record_success()
+                else:
+                    self.breaker.record_failure()
+            if not succeeded:
+                time.sleep(error_delay)
+                continue
+            latency.record(time.monotonic() - started)
+            return result
+
+    def _backoff(self, retry, error):
+        """Full-jitter exponential backoff, honouring Retry-After when Groq sends it."""
+        delay = random.uniform(0, min(self.backoff_cap, self.backoff_base * 2 ** retry))
+        response = getattr(error, "response", None)
+        if response is not None:
+            try:
+                delay = max(delay, float(response.headers.get("retry-after", 0)))
+            except ValueError:
+                pass
+        return delay
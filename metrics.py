@@ -0,0 +1,216 @@
+"""Per-turn latency and token instrumentation.
+
+Each chat turn is recorded as a :class:`Turn` that holds timing spans
+(draw, prompt build, time to first token, completion, render) plus token
+counts, model, cache source and error type. Finished turns feed a
+process-wide :class:`MetricsRegistry`. The registry can be scraped as
+Prometheus text from a small local HTTP endpoint, gives p50/p95/p99
+summaries for the admin view, and appends every turn to a rotating JSONL
+log.
+"""
+
+import json
+import logging
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging.handlers import RotatingFileHandler
+
+# 延迟直方图的分桶（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 1.5, 2, 3, 5, 8, 13, 20)
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in sorted(labels)) + "}"
+
+
+class Histogram:
+    """Prometheus-style cumulative buckets plus a sample window for percentiles."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS, window=2000):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+        self.samples = deque(maxlen=window)
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        self.samples.append(value)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def percentile(self, q):
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class MetricsRegistry:
+    def __init__(self, prefix="oracle"):
+        self.prefix = prefix
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._histograms.setdefault(key, Histogram()).observe(value)
+
+    def register_collector(self, name, collect):
+        """Export ``collect()``'s numeric values as gauges named ``<name>_<key>``."""
+        with self._lock:
+            self._collectors.append((name, collect))
+
+    def summary(self):
+        """p50/p95/p99 for every histogram, keyed by ``name{labels}``."""
+        with self._lock:
+            return {
+                name + _label_text(labels): {
+                    "count": histogram.count,
+                    "p50": histogram.percentile(0.50),
+                    "p95": histogram.percentile(0.95),
+                    "p99": histogram.percentile(0.99),
+                }
+                for (name, labels), histogram in sorted(self._histograms.items())
+            }
+
+    def gauges(self):
+        with self._lock:
+            collectors = list(self._collectors)
+        values = {}
+        for name, collect in collectors:
+            try:
+                stats = collect()
+            except Exception:
+                continue
+            for key, value in stats.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    values[f"{name}_{key}"] = value
+        return values
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted(self._histograms.items())
+        for (name, labels), value in counters:
+            lines.append(f"{self.prefix}_{name}{_label_text(labels)} {value}")
+        for (name, labels), histogram in histograms:
+            metric = f"{self.prefix}_{name}"
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                lines.append(f"{metric}_bucket{_label_text(labels + (('le', bound),))} {count}")
+            lines.append(f"{metric}_bucket{_label_text(labels + (('le', '+Inf'),))} {histogram.count}")
+            lines.append(f"{metric}_sum{_label_text(labels)} {histogram.sum}")
+            lines.append(f"{metric}_count{_label_text(labels)} {histogram.count}")
+        for name, value in sorted(self.gauges().items()):
+            lines.append(f"{self.prefix}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+class Turn:
+    """Timings and attributes of one question/answer turn."""
+
+    def __init__(self, recorder, session_id):
+        self._recorder = recorder
+        self.started = time.perf_counter()
+        self.spans = {}
+        self.attributes = {"session": session_id}
+
+    def span(self, name):
+        return _Span(self, name)
+
+    def add(self, name, seconds):
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def mark(self, name):
+        """Record the time elapsed since the turn started, e.g. ``ttft``."""
+        self.spans[name] = time.perf_counter() - self.started
+        return self.spans[name]
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def finish(self, error=None):
+        if error is not None:
+            self.attributes["error"] = type(error).__name__
+        self.spans["turn"] = time.perf_counter() - self.started
+        self._recorder.record(self)
+
+
+class _Span:
+    def __init__(self, turn, name):
+        self.turn = turn
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.turn.add(self.name, time.perf_counter() - self.started)
+
+
+class TurnRecorder:
+    """Feeds finished turns into a registry and a rotating JSONL log."""
+
+    def __init__(self, registry, log_path=None, max_bytes=10 * 1024 * 1024, backups=5):
+        self.registry = registry
+        self._log = None
+        if log_path:
+            self._log = logging.getLogger(f"{__name__}.turns.{log_path}")
+            self._log.propagate = False
+            self._log.setLevel(logging.INFO)
+            if not self._log.handlers:
+                self._log.addHandler(RotatingFileHandler(log_path, maxBytes=max_bytes, backupCount=backups, encoding="utf-8"))
+
+    def start(self, session_id):
+        return Turn(self, session_id)
+
+    def record(self, turn):
+        attributes = turn.attributes
+        source = attributes.get("source", "none")
+        for name, seconds in turn.spans.items():
+            self.registry.observe("span_seconds", seconds, span=name, source=source)
+        self.registry.inc("turns_total", source=source, error=attributes.get("error", ""))
+        for kind in ("prompt_tokens", "completion_tokens"):
+            if attributes.get(kind) is not None:
+                self.registry.inc("tokens_total", attributes[kind], kind=kind, model=attributes.get("model", ""))
+        if self._log is not None:
+            self._log.info(json.dumps({"ts": time.time(), "spans": turn.spans, **attributes}, ensure_ascii=False))
+
+
+def start_metrics_server(registry, host="127.0.0.1", port=9464):
+    """Serve ``/metrics`` in Prometheus text format from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.prometheus_text().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    return server
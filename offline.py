@@ -0,0 +1,88 @@
+"""Local interpretations that need no network, loaded once from ``interpretations.json``.
+
+The question is classified by keyword into a topic (love, work, money ...)
+and an intent (when / should / will ...). A reading is then put together
+from curated bilingual sentences: an opening for the answer's category, a
+line about the topic and a closing that fits the category and the intent.
+Choices are seeded from the question and answer, so the same pair always
+reads the same. A reading takes well under a millisecond, which makes it
+usable as the primary tier, as the fallback when Groq is unavailable, or as
+an instant draft that the model's reading replaces.
+"""
+
+import hashlib
+import json
+import random
+from dataclasses import dataclass
+
+from interpretation_cache import normalize_question
+
+
+@dataclass(frozen=True)
+class Classification:
+    topic: str
+    intent: str
+
+
+def _matches(text, keyword):
+    """Whole-word match for English keywords, substring match for Chinese ones."""
+    if keyword.isascii():
+        return f" {keyword} " in f" {text} "
+    return keyword in text
+
+
+class OfflineInterpreter:
+    def __init__(self, topics, intents, openings, closings):
+        self.topics = topics
+        self.intents = intents
+        self.openings = openings
+        self.closings = closings
+        self._keywords = {
+            name: topic["keywords"] + topic["keywords_zh"] for name, topic in topics.items()
+        }
+        self._patterns = {
+            name: intent["patterns"] + intent["patterns_zh"] for name, intent in intents.items()
+        }
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["topics"], data["intents"], data["openings"], data["closings"])
+
+    def classify(self, question):
+        """Best-matching topic (most keyword hits) and first matching intent."""
+        text = normalize_question(question)
+        topic, best = "general", 0
+        for name, keywords in self._keywords.items():
+            hits = sum(_matches(text, keyword) for keyword in keywords)
+            if hits > best:
+                topic, best = name, hits
+        intent = next(
+            (name for name, patterns in self._patterns.items() if any(_matches(text, p) for p in patterns)),
+            "general",
+        )
+        return Classification(topic, intent)
+
+    def interpret(self, question, answer):
+        """English sentences, then their Chinese translation on the next line."""
+        classification = self.classify(question)
+        digest = hashlib.blake2b(f"{normalize_question(question)}\0{answer.text}".encode("utf-8"), digest_size=8)
+        rng = random.Random(int.from_bytes(digest.digest(), "big"))
+
+        topic = self.topics[classification.topic]
+        closings = self.closings.get(answer.category, self.closings["cryptic"])
+        sentences = [
+            rng.choice(self.openings.get(answer.category, self.openings["cryptic"])),
+            rng.choice(topic["lines"]),
+            rng.choice(closings.get(classification.intent, closings["general"])),
+        ]
+        fields = {
+            "answer_en": answer.en,
+            "answer_zh": answer.zh,
+            "topic_en": topic["en"],
+            "topic_zh": topic["zh"],
+        }
+        en = " ".join(sentence["en"].format(**fields) for sentence in sentences)
+        zh = "".join(sentence["zh"].format(**fields) for sentence in sentences)
+        return f"{en}\n{zh}"
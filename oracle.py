@@ -0,0 +1,209 @@
+"""Report layout and prompts shared by the app and its background workers.
+
+Two prompt modes are supported:
+
+* ``full`` sends the whole report template and has the model write the
+  complete report, headers and dividers included.
+* ``compact`` sends a constant system prefix, so Groq's prompt caching can
+  reuse it across calls. The model writes only the 2-3 interpretation
+  sentences, with a ``max_tokens`` budget, and the frame is rendered locally
+  with :func:`render_report`.
+
+The micro-batcher uses a compact variant of its own that asks for several
+interpretations at once as JSON (:func:`batch_messages`).
+"""
+
+import json
+import re
+import threading
+
+REPORT_TEMPLATE = """🔮 **ORACLE ANALYSIS REPORT / 命运启示录**
+
+━━━━━━━━━━━━━━━━━━
+
+❓ **The Question / 你的困惑:**
+{question}
+
+✨ **The Answer / 指引:**
+# **{answer}**
+
+📜 **Deep Interpretation / 深度解析:**
+{interpretation}
+
+━━━━━━━━━━━━━━━━━━
+
+🍀 *Trust the process. / 相信命运的安排。*
+"""
+
+# 整份报告里"深度解析"那一节：标题之后、结尾分隔线之前
+_INTERPRETATION_SECTION = re.compile(r"📜 \*\*Deep Interpretation / 深度解析:\*\*\s*(.*?)\s*━{3,}", re.DOTALL)
+
+# 预生成用的 Prompt：不针对具体问题，只解读答案本身
+GENERIC_SYSTEM_PROMPT = """
+You are the "Oracle Interpreter" (命运解读者).
+Someone has drawn a random [Book Answer] from the Book of Answers. You do not know their question.
+Write 2-3 short sentences explaining what this answer could mean for whatever is on their mind.
+
+### GUIDELINES (准则)
+1. **Language:** English first, then the Chinese translation on the next line.
+2. **Tone:** Mystical but simple, gentle, and healing. Do not use complex words. (神秘但通俗易懂，温柔且治愈).
+3. Follow the [Guidance] that comes with the answer's category.
+4. Output only the sentences, without headers or Markdown decoration.
+"""
+
+
+# 紧凑模式的 system prompt 不含任何变量，保证每次请求的前缀完全一致
+COMPACT_SYSTEM_PROMPT = """You are the "Oracle Interpreter" (命运解读者).
+You receive a [Question], the random [Book Answer] drawn for it, and [Guidance] for that kind of answer.
+Write 2-3 short sentences explaining what this answer means for their specific situation. Be supportive.
+Then write the same sentences in Chinese on the next line.
+Tone: mystical but simple, gentle, and healing. No complex words, no headers, no Markdown decoration.
+"""
+
+# 批量模式：一次请求解读多个问题，返回 JSON
+BATCH_SYSTEM_PROMPT = """You are the "Oracle Interpreter" (命运解读者).
+You receive a JSON list of items, each with an "id", a [question], the random [answer] drawn from the Book of Answers, and [guidance] for that kind of answer.
+For every item, write 2-3 short sentences explaining what the answer means for that specific question. Be supportive.
+Then write the same sentences in Chinese on the next line.
+Tone: mystical but simple, gentle, and healing. No complex words, no headers, no Markdown decoration.
+Reply with a JSON object: {"interpretations": [{"id": <id>, "text": "<interpretation>"}, ...]} with one entry per item.
+"""
+
+FULL_SYSTEM_PROMPT = """
+You are the "Oracle Interpreter" (命运解读者).
+Your task is to take the user's [Question] and the random [Book Answer] they received, and generate a spiritual analysis report.
+
+### GUIDELINES (准则)
+1. **Language:** Every section must be bilingual (English first, then Chinese).
+2. **Tone:** Mystical but simple, gentle, and healing. Do not use complex words. (神秘但通俗易懂，温柔且治愈).
+3. **Analysis Logic:** Connect the specific Question to the abstract Answer. {guidance}
+
+### REPORT FORMAT (Strictly follow this Markdown structure)
+
+🔮 **ORACLE ANALYSIS REPORT / 命运启示录**
+
+━━━━━━━━━━━━━━━━━━
+
+❓ **The Question / 你的困惑:**
+{question}
+
+✨ **The Answer / 指引:**
+# **{answer}**
+
+📜 **Deep Interpretation / 深度解析:**
+[Write 2-3 short sentences explaining what this answer means for their specific situation. Be supportive.]
+[用2-3句简短的话解释这个答案对他们的情况意味着什么。保持支持的态度。]
+
+━━━━━━━━━━━━━━━━━━
+
+🍀 *Trust the process. / 相信命运的安排。*
+"""
+
+
+def render_report(question, answer, interpretation):
+    """Fill the fixed report frame with a question, answer and interpretation."""
+    return REPORT_TEMPLATE.format(
+        question=question,
+        answer=answer,
+        interpretation=interpretation.strip(),
+    )
+
+
+def extract_interpretation(report):
+    """The interpretation sentences of a whole report written by the model, or ``None``.
+
+    ``full`` mode leaves the frame to the model, so a report that does not
+    follow it gives ``None``.
+    """
+    match = _INTERPRETATION_SECTION.search(report)
+    if match is None or not match.group(1):
+        return None
+    return match.group(1)
+
+
+def generic_messages(answer, guidance):
+    """Chat messages asking for a question-independent reading of ``answer``."""
+    return [
+        {"role": "system", "content": GENERIC_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Book Answer: {answer}\nGuidance: {guidance}"},
+    ]
+
+
+def full_messages(question, answer, guidance):
+    """Chat messages asking the model to write the whole report."""
+    return [
+        {"role": "system", "content": FULL_SYSTEM_PROMPT.format(question=question, answer=answer, guidance=guidance)},
+        {"role": "user", "content": f"User Question: {question}\nBook Answer: {answer}"},
+    ]
+
+
+def compact_messages(question, answer, guidance):
+    """Chat messages asking only for the interpretation sentences."""
+    return [
+        {"role": "system", "content": COMPACT_SYSTEM_PROMPT},
+        {"role": "user", "content": f"Question: {question}\nBook Answer: {answer}\nGuidance: {guidance}"},
+    ]
+
+
+def batch_messages(items):
+    """Chat messages asking for interpretations of several (question, answer, guidance) items."""
+    payload = [
+        {"id": index, "question": question, "answer": answer, "guidance": guidance}
+        for index, (question, answer, guidance) in enumerate(items)
+    ]
+    return [
+        {"role": "system", "content": BATCH_SYSTEM_PROMPT},
+        {"role": "user", "content": "Items:\n" + json.dumps(payload, ensure_ascii=False)},
+    ]
+
+
+def parse_batch_response(content, count):
+    """Map item index -> interpretation text, skipping anything malformed."""
+    try:
+        entries = json.loads(content)["interpretations"]
+    except (ValueError, KeyError, TypeError):
+        return {}
+    results = {}
+    for entry in entries if isinstance(entries, list) else []:
+        if not isinstance(entry, dict):
+            continue
+        index, text = entry.get("id"), entry.get("text")
+        if isinstance(index, int) and 0 <= index < count and isinstance(text, str) and text.strip():
+            results[index] = text.strip()
+    return results
+
+
+def chunk_usage(chunk):
+    """Token usage carried by a streamed chunk (Groq sends it on the last one)."""
+    if chunk.usage is not None:
+        return chunk.usage
+    if chunk.x_groq is not None:
+        return chunk.x_groq.usage
+    return None
+
+
+class UsageTally:
+    """Running token totals per prompt mode, to compare ``full`` and ``compact``."""
+
+    def __init__(self):
+        self._totals = {}
+        self._lock = threading.Lock()
+
+    def record(self, mode, usage):
+        with self._lock:
+            totals = self._totals.setdefault(mode, {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0})
+            totals["calls"] += 1
+            totals["prompt_tokens"] += usage.prompt_tokens
+            totals["completion_tokens"] += usage.completion_tokens
+
+    def summary(self):
+        """Average prompt/completion tokens per call for each mode."""
+        with self._lock:
+            return {
+                mode: {
+                    "calls": totals["calls"],
+                    "avg_prompt_tokens": totals["prompt_tokens"] / totals["calls"],
+                    "avg_completion_tokens": totals["completion_tokens"] / totals["calls"],
+                }
+                for mode, totals in self._totals.items()
+            }
@@ -0,0 +1,506 @@
+"""The draw -> prompt -> interpret pipeline, usable without Streamlit.
+
+:class:`OraclePipeline` owns every shared, process-wide piece: the answer
+book, the Groq client, the rate-limit scheduler, the interpretation cache,
+the warm pool, the micro-batcher and the speculator. Each piece is built lazily on first use.
+The Streamlit app keeps one pipeline in ``st.cache_resource`` and drives its
+steps one at a time so it can stream into the chat bubble.
+:meth:`OraclePipeline.interpret` runs the whole thing in one blocking call
+for scripts and the command-line tool in ``cli.py``.
+"""
+
+import os
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, fields
+
+from answer_book import AnswerBook
+from batcher import MicroBatcher
+from llm_client import LLMClient
+from offline import OfflineInterpreter
+from oracle import (
+    UsageTally,
+    batch_messages,
+    chunk_usage,
+    compact_messages,
+    extract_interpretation,
+    full_messages,
+    generic_messages,
+    parse_batch_response,
+    render_report,
+)
+from scheduler import CancelledTicketError, DebouncedError, RateLimitScheduler, estimate_tokens
+from speculation import Speculator, likely_repeat
+from state import open_state
+from warm_pool import WarmPool
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+PLACEHOLDER_API_KEY = "gsk_..."
+
+
+@dataclass
+class Settings:
+    """Pipeline options. Each one can be set through the upper-cased name."""
+
+    groq_api_key: str = PLACEHOLDER_API_KEY
+    model: str = "llama-3.3-70b-versatile"
+    # "bespoke"：每个问题单独请求模型；"pooled"：立即使用预生成的解读
+    reading_mode: str = "bespoke"
+    warm_pool_depth: int = 3
+    warm_pool_workers: int = 2
+    # 单次请求的总时限（秒）；对冲请求可以发给更快的小模型
+    llm_deadline_seconds: float = 20.0
+    llm_hedge: bool = False
+    llm_hedge_model: str = "llama-3.1-8b-instant"
+    # 答案库：同一个问题是否总是抽到同一个答案（便于复现和缓存）
+    answers_path: str = os.path.join(ROOT, "answers.json")
+    answer_seeded: bool = False
+    answer_seed_salt: str = ""
+    # "compact"：模型只写解读，报告框架本地渲染；"full"：模型生成整份报告（旧方式，用于对比）
+    prompt_mode: str = "compact"
+    interpretation_max_tokens: int = 220
+    full_report_max_tokens: int = 600
+    cache_max_entries: int = 2048
+    cache_ttl_seconds: int = 24 * 3600
+    # 准入控制：按 Groq 账号的每分钟请求数 / token 数配额排队
+    groq_rpm: int = 30
+    groq_tpm: int = 12000
+    queue_max: int = 100
+    queue_timeout_seconds: float = 60.0
+    debounce_seconds: float = 1.0
+    # 批量模式：把短时间窗口内不同会话的问题合并成一次请求（仅 compact 模式）
+    batch_enabled: bool = False
+    batch_window_ms: int = 100
+    batch_max_size: int = 8
+    # 本地解读：off 关闭；primary 只用本地解读；fallback 模型失败或超时时改用本地解读；
+    # draft 先立即显示本地解读，模型的结果到达后替换。没有配置 GROQ_API_KEY 时总是 primary
+    offline_mode: str = "fallback"
+    offline_templates_path: str = os.path.join(ROOT, "interpretations.json")
+    # 缓存和配额放在哪里：sqlite 让同一台机器上的所有 worker 共用一个 WAL 库；local 只在本进程内存里
+    state_backend: str = "sqlite"
+    state_db: str = os.path.join(ROOT, "state.db")
+    # 推测执行：off 关闭；warm 在输入框出现时预先抽答案、预热 Groq 连接；
+    # prefetch 另外在会话已经重复问过同一个问题后，按"换个说法再问一次"预取解读，猜错就取消（会用掉一部分空闲配额）
+    speculation: str = "off"
+
+    @classmethod
+    def load(cls, get=os.environ.get):
+        """Build settings from ``get(NAME, default)``, e.g. ``os.environ.get``."""
+        values = {}
+        for field in fields(cls):
+            raw = get(field.name.upper(), None)
+            if raw is None:
+                continue
+            if field.type is bool:
+                values[field.name] = str(raw).lower() == "true"
+            else:
+                values[field.name] = field.type(raw)
+        return cls(**values)
+
+
+@dataclass
+class Prompt:
+    """Messages for one interpretation call and how to turn its output into a report."""
+
+    question: str
+    answer: str
+    messages: list
+    max_tokens: int
+    compact: bool
+
+    def report(self, generated):
+        if self.compact:
+            return render_report(self.question, self.answer, generated)
+        return generated
+
+    def interpretation(self, generated):
+        """The part of the output worth caching; ``None`` if a whole report lost its frame."""
+        if self.compact:
+            return generated.strip()
+        return extract_interpretation(generated)
+
+
+@dataclass
+class Reading:
+    question: str
+    answer: object
+    report: str
+    source: str
+    prompt_tokens: int = None
+    completion_tokens: int = None
+    seconds: float = 0.0
+
+
+class OraclePipeline:
+    def __init__(self, settings=None):
+        self.settings = settings or Settings.load()
+        self.usage = UsageTally()
+        self._lock = threading.RLock()
+        self._parts = {}
+
+    # --- shared components, built on first use ---
+
+    def _part(self, name, build):
+        with self._lock:
+            if name not in self._parts:
+                self._parts[name] = build()
+            return self._parts[name]
+
+    @property
+    def answer_book(self):
+        return self._part("answer_book", lambda: AnswerBook.load(self.settings.answers_path))
+
+    @property
+    def client(self):
+        s = self.settings
+        return self._part("client", lambda: LLMClient(
+            s.groq_api_key,
+            timeout=s.llm_deadline_seconds,
+            hedge=s.llm_hedge,
+            hedge_model=s.llm_hedge_model,
+            hedge_budget=self._hedge_budget,
+        ))
+
+    @property
+    def state(self):
+        """Backend for the cache and the quota buckets (see :mod:`state`)."""
+        return self._part("state", lambda: open_state(self.settings.state_backend, self.settings.state_db))
+
+    @property
+    def scheduler(self):
+        s = self.settings
+        return self._part("scheduler", lambda: RateLimitScheduler(
+            requests_per_minute=s.groq_rpm,
+            tokens_per_minute=s.groq_tpm,
+            max_queue=s.queue_max,
+            debounce_seconds=s.debounce_seconds,
+            buckets=self.state.rate_limit_buckets(s.groq_rpm, s.groq_tpm),
+        ))
+
+    @property
+    def cache(self):
+        s = self.settings
+        return self._part("cache", lambda: self.state.interpretation_cache(s.cache_max_entries, s.cache_ttl_seconds))
+
+    @property
+    def warm_pool(self):
+        s = self.settings
+        return self._part("warm_pool", lambda: WarmPool(
+            self.answer_book.answers,
+            self._generate_generic,
+            depth=s.warm_pool_depth,
+            max_workers=s.warm_pool_workers,
+        ).start())
+
+    @property
+    def batcher(self):
+        s = self.settings
+        return self._part("batcher", lambda: MicroBatcher(
+            self._run_batch,
+            self._run_single,
+            window_seconds=s.batch_window_ms / 1000,
+            max_batch=s.batch_max_size,
+        ))
+
+    @property
+    def speculator(self):
+        s = self.settings
+        # 不用模型时不预热也不预取；按问题抽答案时猜不到下一个答案，也不预取
+        online = not self.offline_primary
+        return self._part("speculator", lambda: Speculator(
+            lambda: None if s.answer_seeded else self.answer_book.draw(),
+            warm_up=(lambda: self.client.warm_up()) if online else None,
+            prefetch=self._prefetch if s.speculation == "prefetch" and online and not s.answer_seeded else None,
+            # 只等已经在流式输出的预取，不含排队时间
+            timeout=s.llm_deadline_seconds,
+        ))
+
+    @property
+    def offline(self):
+        return self._part("offline", lambda: OfflineInterpreter.load(self.settings.offline_templates_path))
+
+    @property
+    def offline_primary(self):
+        key = self.settings.groq_api_key
+        return self.settings.offline_mode == "primary" or not key or key == PLACEHOLDER_API_KEY
+
+    @property
+    def batching(self):
+        return self.settings.batch_enabled and self.settings.prompt_mode == "compact"
+
+    def collectors(self):
+        """``(name, stats)`` pairs for the metrics registry.
+
+        Registering them does not build the Groq client or start the warm
+        pool; until those exist their collectors report nothing.
+        """
+        pairs = [
+            ("cache", self.cache.stats),
+            ("queue", self.scheduler.stats),
+        ]
+        if not self.offline_primary:
+            pairs.append(("llm", lambda: self._stats_of("client")))
+        if self.batching:
+            pairs.append(("batch", self.batcher.stats))
+        if self.settings.reading_mode == "pooled":
+            pairs.append(("pool", lambda: self._stats_of("warm_pool")))
+        if self.settings.speculation != "off":
+            pairs.append(("speculation", self.speculator.stats))
+        return pairs
+
+    def _stats_of(self, name):
+        """Stats of a component that has already been built, without building it."""
+        with self._lock:
+            part = self._parts.get(name)
+        return part.stats() if part is not None else {}
+
+    def close(self):
+        """Stop background work so a script can exit without waiting for the warm pool."""
+        with self._lock:
+            for name in ("warm_pool", "speculator"):
+                if name in self._parts:
+                    self._parts[name].shutdown()
+
+    # --- pipeline steps ---
+
+    def draw(self, question):
+        if self.settings.answer_seeded:
+            return self.answer_book.draw(question, salt=self.settings.answer_seed_salt)
+        return self.answer_book.draw()
+
+    def speculate(self, session_id, questions=()):
+        """Prepare for the session's next question while the user types (see :mod:`speculation`).
+
+        ``questions`` are the ones the session has asked so far, oldest first.
+        """
+        if self.settings.speculation != "off":
+            self.speculator.prepare(session_id, likely_repeat(questions))
+
+    def claim(self, session_id, question, waiting=None):
+        """The answer for a submitted question and, if a speculative reading matched, its report.
+
+        ``waiting()`` wraps the wait for a prefetch that is still streaming.
+        """
+        if self.settings.speculation == "off":
+            return self.draw(question), None
+        answer, interpretation = self.speculator.claim(session_id, question, waiting or nullcontext)
+        if interpretation is None:
+            return answer or self.draw(question), None
+        return answer, render_report(question, answer.text, interpretation)
+
+    def lookup(self, question, answer):
+        """A ready report from the cache or the warm pool: ``(source, report)`` or ``(None, None)``."""
+        cached = self.cache.get(question, answer.text)
+        if cached is not None:
+            # 命中缓存：复用之前的解读，用这次的原话重新渲染报告框架
+            return "cache", render_report(question, answer.text, cached.interpretation)
+        if self.settings.reading_mode == "pooled":
+            pooled = self.warm_pool.take(answer)
+            if pooled is not None:
+                # 预生成池：把通用解读套进这次问题的报告框架
+                self.cache.put(question, answer.text, pooled.strip())
+                return "pool", render_report(question, answer.text, pooled)
+        return None, None
+
+    def offline_report(self, question, answer):
+        """A complete report from the local interpreter; not cached, so the model can still answer later."""
+        return render_report(question, answer.text, self.offline.interpret(question, answer))
+
+    def can_fall_back(self, error):
+        """Whether a failed LLM call should be answered locally instead of shown as an error."""
+        return self.settings.offline_mode in ("fallback", "draft") and not isinstance(error, DebouncedError)
+
+    def prompt(self, question, answer):
+        guidance = self.answer_book.guidance(answer)
+        if self.settings.prompt_mode == "compact":
+            # 只让模型写解读，报告框架在本地渲染
+            return Prompt(
+                question, answer.text,
+                compact_messages(question, answer.text, guidance),
+                self.settings.interpretation_max_tokens,
+                compact=True,
+            )
+        return Prompt(
+            question, answer.text,
+            full_messages(question, answer.text, guidance),
+            self.settings.full_report_max_tokens,
+            compact=False,
+        )
+
+    def acquire(self, prompt, session_id, on_wait=None):
+        """Wait for a scheduler slot for ``prompt`` and return its ticket."""
+        return self.scheduler.acquire(
+            session_id,
+            estimate_tokens(prompt.messages, prompt.max_tokens),
+            on_wait=on_wait,
+            timeout=self.settings.queue_timeout_seconds,
+        )
+
+    def open_stream(self, prompt):
+        """Start streaming once a slot is held; returns ``(text_chunks, usage)``.
+
+        Blocks until the first chunk has arrived. ``usage["usage"]`` is
+        filled in once the stream has been consumed.
+        """
+        stream = self.client.stream(
+            messages=prompt.messages,
+            model=self.settings.model,
+            temperature=0.7,
+            max_tokens=prompt.max_tokens,
+        )
+        usage = {}
+        return self._stream_text(stream, usage), usage
+
+    def start_warm_pool(self):
+        """Start filling the warm pool in the background (it imports and builds the Groq client)."""
+        self.warm_pool
+
+    def submit_batched(self, question, answer, session_id):
+        """Queue a reading for the next batched call; debounced per session like :meth:`acquire`."""
+        # 批量调用本身不按会话排队，所以在这里防抖
+        self.scheduler.debounce(session_id)
+        return self.batcher.submit(question, answer.text, self.answer_book.guidance(answer), session_id)
+
+    def finish(self, question, answer, interpretation, usage=None, ticket=None):
+        """Book-keeping after a generated reading: settle the quota, tally tokens, cache the interpretation."""
+        if usage is not None:
+            if ticket is not None:
+                ticket.settle(usage.total_tokens)
+            self.usage.record(self.settings.prompt_mode, usage)
+        if interpretation:
+            self.cache.put(question, answer.text, interpretation)
+
+    def interpret(self, question, session_id="pipeline", answer=None):
+        """Run the whole pipeline for one question and return a :class:`Reading`."""
+        started = time.perf_counter()
+        answer = answer or self.draw(question)
+        source, report = self.lookup(question, answer)
+        usage = None
+        if report is None and self.offline_primary:
+            source, report = "offline", self.offline_report(question, answer)
+        elif report is None:
+            try:
+                if self.batching:
+                    source = "batch"
+                    item = self.submit_batched(question, answer, session_id)
+                    timeout = self.settings.queue_timeout_seconds + self.settings.llm_deadline_seconds
+                    interpretation = item.future.result(timeout=timeout)
+                    report = render_report(question, answer.text, interpretation)
+                    self.finish(question, answer, interpretation)
+                else:
+                    source = "llm"
+                    prompt = self.prompt(question, answer)
+                    ticket = self.acquire(prompt, session_id)
+                    chunks, stream_usage = self.open_stream(prompt)
+                    generated = "".join(chunks)
+                    report = prompt.report(generated)
+                    usage = stream_usage.get("usage")
+                    self.finish(question, answer, prompt.interpretation(generated), usage, ticket)
+            except Exception as e:
+                if not self.can_fall_back(e):
+                    raise
+                source, report, usage = "offline", self.offline_report(question, answer), None
+        return Reading(
+            question=question,
+            answer=answer,
+            report=report,
+            source=source,
+            prompt_tokens=usage.prompt_tokens if usage is not None else None,
+            completion_tokens=usage.completion_tokens if usage is not None else None,
+            seconds=time.perf_counter() - started,
+        )
+
+    # --- background work ---
+
+    @staticmethod
+    def _stream_text(stream, usage):
+        """Yield the non-empty text deltas of a streaming chat completion."""
+        for chunk in stream:
+            if chunk_usage(chunk) is not None:
+                usage["usage"] = chunk_usage(chunk)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+
+    def _complete(self, messages, session_id, max_tokens, mode, background=False, **options):
+        ticket = self.scheduler.acquire(
+            session_id,
+            estimate_tokens(messages, max_tokens),
+            timeout=self.settings.queue_timeout_seconds,
+            background=background,
+            debounce=False,
+        )
+        chat_completion = self.client.create(
+            messages=messages,
+            model=self.settings.model,
+            temperature=0.9 if background else 0.7,
+            max_tokens=max_tokens,
+            **options,
+        )
+        if chat_completion.usage is not None:
+            ticket.settle(chat_completion.usage.total_tokens)
+            self.usage.record(mode, chat_completion.usage)
+        return chat_completion.choices[0].message.content
+
+    def _hedge_budget(self, messages, max_tokens):
+        """Charge a hedged request to the quota buckets; ``False`` when they have too little to spare."""
+        # 对冲请求的用量不回填，按估算的上限扣
+        return self.scheduler.try_acquire("hedge", estimate_tokens(messages, max_tokens)) is not None
+
+    def _prefetch(self, speculation):
+        """Stream a speculative interpretation in the background, stopping as soon as it is cancelled."""
+        prompt = self.prompt(speculation.question, speculation.answer)
+        ticket = self.scheduler.acquire(
+            f"speculation:{speculation.session_id}",
+            estimate_tokens(prompt.messages, prompt.max_tokens),
+            timeout=self.settings.queue_timeout_seconds,
+            background=True,
+            debounce=False,
+            cancel=speculation.cancel,
+        )
+        if speculation.cancel.is_set():
+            ticket.settle(0)
+            raise CancelledTicketError("Speculation cancelled")
+        speculation.called = True
+        stream = self.client.stream(
+            messages=prompt.messages,
+            model=self.settings.model,
+            temperature=0.7,
+            max_tokens=prompt.max_tokens,
+        )
+        usage = {}
+        generated = ""
+        try:
+            for text in self._stream_text(stream, usage):
+                if speculation.cancel.is_set():
+                    # 断开流，模型不再继续生成；按已生成的部分估算用掉的 token
+                    ticket.settle(estimate_tokens(prompt.messages, len(generated) // 3))
+                    raise CancelledTicketError("Speculation cancelled")
+                generated += text
+        finally:
+            stream.close()
+        interpretation = prompt.interpretation(generated)
+        self.finish(speculation.question, speculation.answer, interpretation, usage.get("usage"), ticket)
+        return interpretation
+
+    def _generate_generic(self, answer):
+        messages = generic_messages(answer.text, self.answer_book.guidance(answer))
+        return self._complete(messages, "warm-pool", self.settings.interpretation_max_tokens, "pool", background=True)
+
+    def _run_batch(self, items):
+        content = self._complete(
+            batch_messages([(item.question, item.answer, item.guidance) for item in items]),
+            "micro-batch",
+            self.settings.interpretation_max_tokens * len(items),
+            "batch",
+            response_format={"type": "json_object"},
+        )
+        return parse_batch_response(content, len(items))
+
+    def _run_single(self, item):
+        return self._complete(
+            compact_messages(item.question, item.answer, item.guidance),
+            item.session_id,
+            self.settings.interpretation_max_tokens,
+            "compact",
+        )
@@ -0,0 +1,295 @@
+"""Process-wide admission control in front of the Groq API.
+
+Every LLM call first takes a ticket from :class:`RateLimitScheduler`. Token
+buckets sized to the account's requests-per-minute and tokens-per-minute
+quotas decide when the next call may start. Waiting tickets are served
+round-robin across sessions, so one busy session cannot starve the others.
+The queue is bounded, and a session that submits again too quickly is
+debounced. Background work such as the warm pool only runs when nobody is
+waiting and part of the quota is still unused. Throughput then stays close
+to the quota ceiling instead of running into a storm of 429s.
+
+The quota buckets themselves are pluggable. :class:`LocalBuckets` keeps them
+in this process. ``state.SQLiteBuckets`` shares them between all workers on
+a node, so several processes together stay under one account's quota.
+"""
+
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class AdmissionError(Exception):
+    """Base class for requests the scheduler refuses to run."""
+
+
+class QueueFullError(AdmissionError):
+    pass
+
+
+class QueueTimeoutError(AdmissionError):
+    pass
+
+
+class CancelledTicketError(AdmissionError):
+    pass
+
+
+class DebouncedError(AdmissionError):
+    pass
+
+
+def estimate_tokens(messages, max_tokens):
+    """Rough token cost of a call: ~3 characters per prompt token plus the output budget."""
+    return sum(len(message["content"]) for message in messages) // 3 + max_tokens
+
+
+class TokenBucket:
+    """Classic token bucket; not thread-safe on its own."""
+
+    def __init__(self, rate_per_second, capacity, tokens=None, updated=None, clock=time.monotonic):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity if tokens is None else tokens
+        self.updated = clock() if updated is None else updated
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Seconds until ``amount`` tokens are available (0 if they already are)."""
+        self._refill()
+        missing = min(amount, self.capacity) - self.tokens
+        return max(missing, 0) / self.rate
+
+    def take(self, amount):
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount):
+        """Give back (positive) or charge extra (negative) tokens after the fact."""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+def take_quota(requests, token_bucket, tokens, reserve=0.0):
+    """Take one request and ``tokens`` from the two buckets, or neither.
+
+    Both must hold the amount plus ``reserve`` of their capacity. Returns 0
+    when the quota was taken, otherwise the seconds to wait before trying
+    again.
+    """
+    wait = max(
+        requests.wait_time(1 + reserve * requests.capacity),
+        token_bucket.wait_time(tokens + reserve * token_bucket.capacity),
+    )
+    if wait == 0:
+        requests.take(1)
+        token_bucket.take(tokens)
+    return wait
+
+
+class LocalBuckets:
+    """Requests-per-minute and tokens-per-minute buckets kept in this process."""
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self.requests = TokenBucket(requests_per_minute / 60, requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute / 60, tokens_per_minute)
+
+    def try_take(self, tokens, reserve=0.0):
+        return take_quota(self.requests, self.token_bucket, tokens, reserve)
+
+    def adjust(self, amount):
+        self.token_bucket.adjust(amount)
+
+    def available(self):
+        """``(requests, tokens)`` currently in the buckets."""
+        return self.requests.tokens, self.token_bucket.tokens
+
+
+class Ticket:
+    def __init__(self, scheduler, session_id, tokens, background=False):
+        self.scheduler = scheduler
+        self.session_id = session_id
+        self.tokens = tokens
+        self.background = background
+        self.enqueued = time.monotonic()
+        self.waited = 0.0
+
+    def settle(self, actual_tokens):
+        """Correct the token bucket once the real usage is known."""
+        self.scheduler._settle(self.tokens - actual_tokens)
+
+
+class RateLimitScheduler:
+    def __init__(
+        self,
+        requests_per_minute,
+        tokens_per_minute,
+        max_queue=100,
+        debounce_seconds=1.0,
+        background_reserve=0.5,
+        buckets=None,
+    ):
+        self.buckets = buckets or LocalBuckets(requests_per_minute, tokens_per_minute)
+        self.max_queue = max_queue
+        self.debounce_seconds = debounce_seconds
+        # 后台任务只能用掉配额的这一部分之外的余量
+        self.background_reserve = background_reserve
+        self._cond = threading.Condition()
+        # session_id -> deque of waiting tickets, in round-robin order
+        self._queues = OrderedDict()
+        self._background = deque()
+        self._last_submit = {}
+        self.admitted = 0
+        self.rejected = 0
+        self.debounced = 0
+        self.cancelled = 0
+        self.declined = 0
+        self.total_wait = 0.0
+
+    def acquire(self, session_id, tokens, on_wait=None, timeout=60.0, background=False, debounce=None, cancel=None):
+        """Block until the call may start and return its :class:`Ticket`.
+
+        ``on_wait(position)`` is called whenever the ticket's 1-based place in
+        line changes, so the UI can show it. ``background`` tickets only run
+        behind every foreground ticket. Only foreground tickets are debounced
+        unless ``debounce`` says otherwise. Setting the ``cancel`` event
+        (a ``threading.Event``) gives up the place in line without taking quota.
+        """
+        now = time.monotonic()
+        if debounce is None:
+            debounce = not background
+        with self._cond:
+            if debounce:
+                self._debounce(session_id, now)
+            if self._queued() >= self.max_queue:
+                self.rejected += 1
+                raise QueueFullError("Too many requests are waiting")
+            ticket = Ticket(self, session_id, tokens, background)
+            if background:
+                self._background.append(ticket)
+            else:
+                self._queues.setdefault(session_id, deque()).append(ticket)
+
+        deadline = now + timeout
+        reported = None
+        while True:
+            with self._cond:
+                if cancel is not None and cancel.is_set():
+                    self._dequeue(ticket)
+                    self.cancelled += 1
+                    self._cond.notify_all()
+                    raise CancelledTicketError("Cancelled while waiting for a slot")
+                position = self._position(ticket)
+                if position == 1:
+                    wait = self.buckets.try_take(tokens, self.background_reserve if background else 0)
+                    if wait == 0:
+                        self._dequeue(ticket)
+                        ticket.waited = time.monotonic() - ticket.enqueued
+                        self.admitted += 1
+                        self.total_wait += ticket.waited
+                        self._cond.notify_all()
+                        return ticket
+                else:
+                    wait = 0.5
+                if time.monotonic() >= deadline:
+                    self._dequeue(ticket)
+                    self.rejected += 1
+                    self._cond.notify_all()
+                    raise QueueTimeoutError("Waited too long for a free slot")
+                if position == reported or on_wait is None:
+                    self._cond.wait(min(wait, 0.5, max(deadline - time.monotonic(), 0)))
+                    continue
+            reported = position
+            on_wait(position)
+
+    def debounce(self, session_id):
+        """Count a submission from ``session_id`` without taking a ticket.
+
+        For work that reaches the model some other way (the micro-batcher).
+        Raises :class:`DebouncedError` like :meth:`acquire` does.
+        """
+        with self._cond:
+            self._debounce(session_id, time.monotonic())
+
+    def try_acquire(self, session_id, tokens):
+        """A ticket for an optional extra call (a hedge) if it can start now, else ``None``.
+
+        It never waits, and like a background ticket it only gets quota that
+        nobody queued needs and that leaves ``background_reserve`` unused.
+        """
+        with self._cond:
+            if self._queued() or self.buckets.try_take(tokens, self.background_reserve) != 0:
+                self.declined += 1
+                return None
+            self.admitted += 1
+            return Ticket(self, session_id, tokens, background=True)
+
+    def stats(self):
+        with self._cond:
+            self._forget_old_submits()
+            requests_available, tokens_available = self.buckets.available()
+            return {
+                "queued": self._queued(),
+                "background_queued": len(self._background),
+                "waiting_sessions": len(self._queues),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "debounced": self.debounced,
+                "cancelled": self.cancelled,
+                "declined": self.declined,
+                "avg_wait": self.total_wait / self.admitted if self.admitted else 0.0,
+                "requests_available": requests_available,
+                "tokens_available": tokens_available,
+            }
+
+    def _queued(self):
+        return sum(len(queue) for queue in self._queues.values()) + len(self._background)
+
+    def _position(self, ticket):
+        """1-based place of ``ticket`` in the round-robin service order."""
+        if ticket.background:
+            foreground = sum(len(queue) for queue in self._queues.values())
+            return foreground + self._background.index(ticket) + 1
+        queues = list(self._queues.values())
+        index = self._queues[ticket.session_id].index(ticket)
+        mine = list(self._queues).index(ticket.session_id)
+        ahead = 0
+        for i, queue in enumerate(queues):
+            # 轮询：排在我前面的会话本轮也会被服务一次
+            ahead += min(len(queue), index + (1 if i < mine else 0))
+        return ahead + 1
+
+    def _dequeue(self, ticket):
+        if ticket.background:
+            self._background.remove(ticket)
+            return
+        queue = self._queues[ticket.session_id]
+        queue.remove(ticket)
+        del self._queues[ticket.session_id]
+        if queue:
+            # 刚被服务的会话排到队尾
+            self._queues[ticket.session_id] = queue
+
+    def _settle(self, amount):
+        with self._cond:
+            self.buckets.adjust(amount)
+            self._cond.notify_all()
+
+    def _debounce(self, session_id, now):
+        last = self._last_submit.get(session_id)
+        if last is not None and now - last < self.debounce_seconds:
+            self.debounced += 1
+            raise DebouncedError("Submitted again too quickly")
+        self._last_submit[session_id] = now
+        if len(self._last_submit) > 1000:
+            self._forget_old_submits()
+
+    def _forget_old_submits(self):
+        cutoff = time.monotonic() - self.debounce_seconds
+        for session_id in [s for s, t in self._last_submit.items() if t < cutoff]:
+            del self._last_submit[session_id]
@@ -0,0 +1,264 @@
+"""Speculative work for a session's next question, done before it is asked.
+
+Streamlit only tells the server about a question once it is submitted, so
+there is no "focus" or "typing" event to react to. The nearest point is the
+moment the chat input has been rendered, when the user can start typing.
+From then on, a :class:`Speculator` can do the following for the session:
+
+* draw the next book answer ahead of time. An unseeded draw does not depend
+  on the question, so drawing early changes nothing. A seeded draw does, so
+  there is nothing to pre-draw then;
+* warm up the Groq client: import the SDK, build the client and open a pooled
+  connection. The first question then skips the import and the handshake;
+* optionally start a reading for the question the session is most likely to
+  ask next. That is a rewording of the last question, but only once the
+  session has already asked one question twice (see :func:`likely_repeat`).
+  Guessing after every turn would spend a whole call on most turns, since
+  most people move on to a new question. A near-duplicate submission (see
+  :mod:`interpretation_cache`) waits for that reading if it is already
+  streaming. A prefetch that is still queued is cancelled instead, since it
+  waits behind every real question, and the submission takes the normal
+  path. Any other submission cancels it too. A cancelled prefetch that is
+  still queued gives up its place without taking quota. One that is
+  already streaming is cut off.
+
+Prefetches run as background scheduler tickets, so they never hold up a real
+question. ``stats()`` reports hits, prefetches cancelled in time, wasted calls
+and the seconds saved.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+
+from interpretation_cache import jaccard, ngrams, normalize_question, same_words
+
+
+def similar(question, guess, min_similarity=0.6):
+    """Whether two questions count as the same, by the cache's near-duplicate rule."""
+    question, guess = normalize_question(question), normalize_question(guess)
+    return jaccard(ngrams(question), ngrams(guess)) >= min_similarity and same_words(question, guess)
+
+
+def likely_repeat(questions, window=5):
+    """The session's last question if it rewords one of the ``window`` before it, else ``None``.
+
+    Someone who has asked the book the same thing twice is likely to ask it
+    again, so that is the only time a prefetch is worth its call.
+    """
+    if len(questions) < 2:
+        return None
+    last = questions[-1]
+    if any(similar(last, earlier) for earlier in questions[-window - 1:-1]):
+        return last
+    return None
+
+
+class Speculation:
+    """Work prepared for one session: a pre-drawn answer and maybe a reading in flight."""
+
+    def __init__(self, session_id, answer, question=None):
+        self.session_id = session_id
+        self.answer = answer
+        self.question = question
+        self.cancel = threading.Event()
+        self.started = time.monotonic()
+        self.future = None
+        # 预取的调用是否已经真正发出（排队时取消不花配额）
+        self.called = False
+        self.duration = None
+        self.discarded = False
+        self.counted = False
+
+
+class Speculator:
+    def __init__(
+        self,
+        draw,
+        warm_up=None,
+        prefetch=None,
+        match=similar,
+        timeout=80.0,
+        max_workers=2,
+        max_sessions=1000,
+        warm_interval=20.0,
+    ):
+        """``draw()`` returns an answer or ``None``; ``prefetch(speculation)`` returns a reading.
+
+        Without ``prefetch`` only answers are pre-drawn and the client warmed.
+        ``warm_up()``, if given, runs at most once every ``warm_interval`` seconds.
+        """
+        self._draw = draw
+        self._warm_up = warm_up
+        self._prefetch = prefetch
+        self._match = match
+        self.timeout = timeout
+        self.max_sessions = max_sessions
+        self.warm_interval = warm_interval
+        self._sessions = OrderedDict()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculation")
+        self._lock = threading.Lock()
+        self._last_warm = None
+        self.predrawn = 0
+        self.warmups = 0
+        self.prefetched = 0
+        self.hits = 0
+        self.misses = 0
+        self.preempted = 0
+        self.cancelled = 0
+        self.wasted = 0
+        self.errors = 0
+        self.saved_seconds = 0.0
+
+    def prepare(self, session_id, likely_question=None):
+        """Get ready for the session's next question, guessing it is like ``likely_question``."""
+        guess = likely_question if self._prefetch is not None else None
+        with self._lock:
+            current = self._sessions.get(session_id)
+            if current is not None and current.question == guess:
+                # 同一个会话重跑页面：已经准备好了
+                self._sessions.move_to_end(session_id)
+                return current
+            now = time.monotonic()
+            warm = self._warm_up is not None and (
+                self._last_warm is None or now - self._last_warm >= self.warm_interval
+            )
+            if warm:
+                self._last_warm = now
+
+        speculation = Speculation(session_id, self._draw(), guess)
+        if guess:
+            speculation.future = self._executor.submit(self._run, speculation)
+            speculation.future.add_done_callback(lambda _: self._count(speculation))
+        if warm:
+            self._executor.submit(self._warm)
+
+        stale = []
+        with self._lock:
+            self.predrawn += speculation.answer is not None
+            self.prefetched += speculation.future is not None
+            previous = self._sessions.pop(session_id, None)
+            if previous is not None:
+                stale.append(previous)
+            self._sessions[session_id] = speculation
+            while len(self._sessions) > self.max_sessions:
+                stale.append(self._sessions.popitem(last=False)[1])
+        for old in stale:
+            self._discard(old)
+        return speculation
+
+    def claim(self, session_id, question, waiting=nullcontext):
+        """``(answer, reading)`` prepared for ``question``; either can be ``None``.
+
+        The answer is the pre-drawn one. The reading is what ``prefetch``
+        returned, if the guess matched and the call was already under way.
+        The wait for it runs inside ``waiting()``, e.g. a spinner.
+        """
+        with self._lock:
+            speculation = self._sessions.pop(session_id, None)
+        if speculation is None:
+            return None, None
+        if speculation.future is None:
+            return speculation.answer, None
+        if not self._match(question, speculation.question):
+            with self._lock:
+                self.misses += 1
+            self._discard(speculation)
+            return speculation.answer, None
+        if not speculation.called:
+            # 预取还在排队：后台票要等所有前台请求之后，还要配额足够富余才轮到，
+            # 让真正的问题自己排前台队列更快
+            with self._lock:
+                self.preempted += 1
+            self._discard(speculation)
+            return speculation.answer, None
+
+        claimed = time.monotonic()
+        try:
+            with waiting():
+                reading = speculation.future.result(timeout=self.timeout)
+        except Exception:
+            # 预取失败或太慢：按正常流程再请求一次
+            self._discard(speculation)
+            return speculation.answer, None
+        with self._lock:
+            self.hits += 1
+            # 用户提交时预取已经跑了多久，就省下了多久（最多是整个预取的耗时）
+            self.saved_seconds += min(claimed - speculation.started, speculation.duration)
+        return speculation.answer, reading
+
+    def stats(self):
+        with self._lock:
+            settled = self.hits + self.cancelled + self.wasted
+            return {
+                "sessions": len(self._sessions),
+                "predrawn": self.predrawn,
+                "warmups": self.warmups,
+                "prefetched": self.prefetched,
+                "hits": self.hits,
+                "misses": self.misses,
+                "preempted": self.preempted,
+                "cancelled": self.cancelled,
+                "wasted": self.wasted,
+                "errors": self.errors,
+                "hit_rate": self.hits / settled if settled else 0.0,
+                "saved_seconds": self.saved_seconds,
+                "avg_saved_seconds": self.saved_seconds / self.hits if self.hits else 0.0,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            stale = list(self._sessions.values())
+            self._sessions.clear()
+        for speculation in stale:
+            self._discard(speculation)
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _warm(self):
+        try:
+            self._warm_up()
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            return
+        with self._lock:
+            self.warmups += 1
+
+    def _run(self, speculation):
+        started = time.monotonic()
+        try:
+            return self._prefetch(speculation)
+        except Exception:
+            if not speculation.cancel.is_set():
+                with self._lock:
+                    self.errors += 1
+            raise
+        finally:
+            speculation.duration = time.monotonic() - started
+
+    def _discard(self, speculation):
+        """Cancel a speculation whose reading will not be used."""
+        speculation.cancel.set()
+        with self._lock:
+            speculation.discarded = True
+        if speculation.future is not None:
+            if speculation.future.cancel():
+                # 还没开始运行，回调里会计为取消
+                return
+            if speculation.future.done():
+                self._count(speculation)
+
+    def _count(self, speculation):
+        """Count a discarded prefetch once it has also stopped: cancelled in time, or wasted."""
+        with self._lock:
+            if not speculation.discarded or speculation.counted:
+                return
+            if not (speculation.future.done() or speculation.future.cancelled()):
+                return
+            speculation.counted = True
+            if speculation.called:
+                self.wasted += 1
+            else:
+                self.cancelled += 1
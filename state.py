@@ -0,0 +1,348 @@
+"""Where the state shared between readings lives: in this process or in SQLite.
+
+One Streamlit or CLI process keeps its interpretation cache and its Groq
+quota buckets in memory (:class:`LocalState`). Once several workers serve
+the same node, each of them would otherwise warm its own cache and spend
+the full quota on its own. :class:`SQLiteState` moves both into one SQLite
+file in WAL mode, so all workers see the same cache and draw from the same
+buckets. Readers never block writers, and each write is one short
+``BEGIN IMMEDIATE`` transaction. Session transcripts were already in SQLite
+(:mod:`history`). With a shared backend, the in-memory windows are also
+refreshed when another worker has written to the session.
+
+    STATE_BACKEND=sqlite STATE_DB=/var/lib/oracle/state.db streamlit run app.py
+"""
+
+import hashlib
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+
+from history import HistoryStore
+from interpretation_cache import (
+    CacheEntry,
+    InterpretationCache,
+    jaccard,
+    lsh_bands,
+    minhash,
+    ngrams,
+    normalize_question,
+    same_words,
+)
+from scheduler import LocalBuckets, TokenBucket, take_quota
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    normalized TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    question TEXT NOT NULL,
+    interpretation TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    last_used REAL NOT NULL,
+    PRIMARY KEY (normalized, answer)
+);
+CREATE INDEX IF NOT EXISTS cache_entries_lru ON cache_entries (last_used);
+CREATE TABLE IF NOT EXISTS cache_bands (
+    normalized TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    band INTEGER NOT NULL,
+    value INTEGER NOT NULL,
+    PRIMARY KEY (normalized, answer, band)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS cache_bands_lookup ON cache_bands (answer, band, value);
+CREATE TABLE IF NOT EXISTS counters (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO counters (name, value) VALUES ('cache_entries', 0);
+-- 条目数和 LSH 索引由触发器维护，淘汰时不用 COUNT(*) 也不会留下孤儿分段
+CREATE TRIGGER IF NOT EXISTS cache_entries_added AFTER INSERT ON cache_entries BEGIN
+    UPDATE counters SET value = value + 1 WHERE name = 'cache_entries';
+END;
+CREATE TRIGGER IF NOT EXISTS cache_entries_removed AFTER DELETE ON cache_entries BEGIN
+    UPDATE counters SET value = value - 1 WHERE name = 'cache_entries';
+    DELETE FROM cache_bands WHERE normalized = old.normalized AND answer = old.answer;
+END;
+CREATE TABLE IF NOT EXISTS rate_buckets (
+    name TEXT PRIMARY KEY,
+    tokens REAL NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+# 库结构的版本（PRAGMA user_version）。缓存可以随时丢掉，旧版本的缓存表直接删了重建
+SCHEMA_VERSION = 1
+DROP_CACHE = """
+DROP TABLE IF EXISTS cache_entries;
+DROP TABLE IF EXISTS cache_bands;
+DROP TABLE IF EXISTS counters;
+"""
+
+
+class StateDatabase:
+    """One connection to the shared state file, safe to share between threads."""
+
+    def __init__(self, path):
+        self.path = path
+        # isolation_level=None：事务由 transaction() 显式控制
+        self._conn = sqlite3.connect(path, timeout=5.0, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._lock = threading.Lock()
+        with self._lock:
+            (version,) = self._conn.execute("PRAGMA user_version").fetchone()
+            if version < SCHEMA_VERSION:
+                self._conn.executescript(DROP_CACHE)
+            self._conn.executescript(SCHEMA)
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    @contextmanager
+    def transaction(self):
+        """A write transaction that holds the database lock from its first statement."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def execute(self, sql, parameters=()):
+        """Run one statement in its own implicit transaction and return all rows."""
+        with self._lock:
+            return self._conn.execute(sql, parameters).fetchall()
+
+
+@lru_cache(maxsize=4096)
+def _grams(normalized):
+    """Bigram set of a stored question; kept per process, since the database only has the text."""
+    return frozenset(ngrams(normalized))
+
+
+def _band_value(band):
+    """The rows of an LSH band folded into one signed 64-bit integer for SQLite."""
+    digest = hashlib.blake2b(repr(band[1]).encode("ascii"), digest_size=8).digest()
+    return int.from_bytes(digest, "big", signed=True)
+
+
+class SQLiteInterpretationCache:
+    """:class:`interpretation_cache.InterpretationCache` kept in a shared SQLite file.
+
+    Same interface and matching rules. The entry count is shared by all
+    workers, the hit and miss counters are per process. Expiry times are
+    wall-clock, since they are compared across processes.
+    """
+
+    def __init__(self, db, max_entries=2048, ttl_seconds=24 * 3600, min_similarity=0.6):
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, question, answer):
+        """Return the cached entry for this question/answer, or ``None``."""
+        normalized = normalize_question(question)
+        now = time.time()
+        rows = self.db.execute(
+            "SELECT question, interpretation, expires_at FROM cache_entries WHERE normalized = ? AND answer = ?",
+            (normalized, answer),
+        )
+        if rows and rows[0][2] > now:
+            self._touch(normalized, answer, now)
+            self._count("hits")
+            return self._entry(normalized, answer, *rows[0])
+
+        entry = self._nearest(normalized, answer, now)
+        self._count("near_hits" if entry is not None else "misses")
+        return entry
+
+    def put(self, question, answer, interpretation):
+        normalized = normalize_question(question)
+        bands = lsh_bands(minhash(ngrams(normalized)))
+        now = time.time()
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM cache_entries WHERE normalized = ? AND answer = ?", (normalized, answer))
+            conn.execute(
+                "INSERT INTO cache_entries (normalized, answer, question, interpretation, expires_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (normalized, answer, question, interpretation, now + self.ttl_seconds, now),
+            )
+            conn.executemany(
+                "INSERT INTO cache_bands (normalized, answer, band, value) VALUES (?, ?, ?, ?)",
+                [(normalized, answer, band[0], _band_value(band)) for band in bands],
+            )
+            (count,) = conn.execute("SELECT value FROM counters WHERE name = 'cache_entries'").fetchone()
+            excess = count - self.max_entries
+            if excess > 0:
+                # 沿 last_used 索引删掉最久未用的几条，和内存版一样只碰被淘汰的条目
+                conn.execute(
+                    "DELETE FROM cache_entries WHERE rowid IN "
+                    "(SELECT rowid FROM cache_entries ORDER BY last_used LIMIT ?)",
+                    (excess,),
+                )
+                self._count("evictions", excess)
+
+    def stats(self):
+        rows = self.db.execute("SELECT value FROM counters WHERE name = 'cache_entries'")
+        with self._lock:
+            lookups = self.hits + self.near_hits + self.misses
+            return {
+                "entries": rows[0][0],
+                "hits": self.hits,
+                "near_hits": self.near_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            }
+
+    def _nearest(self, normalized, answer, now):
+        grams = _grams(normalized)
+        bands = lsh_bands(minhash(grams))
+        values = ", ".join("(?, ?)" for _ in bands)
+        parameters = [value for band in bands for value in (band[0], _band_value(band))]
+        candidates = self.db.execute(
+            "SELECT DISTINCT e.normalized "
+            f"FROM (VALUES {values}) AS v "
+            "JOIN cache_bands b ON b.answer = ? AND b.band = v.column1 AND b.value = v.column2 "
+            "JOIN cache_entries e ON e.normalized = b.normalized AND e.answer = b.answer "
+            "WHERE e.expires_at > ?",
+            parameters + [answer, now],
+        )
+
+        best, best_similarity = None, self.min_similarity
+        for (candidate,) in candidates:
+            similarity = jaccard(grams, _grams(candidate))
+            if similarity >= best_similarity and same_words(normalized, candidate):
+                best, best_similarity = candidate, similarity
+        if best is None:
+            return None
+        rows = self.db.execute(
+            "SELECT question, interpretation, expires_at FROM cache_entries WHERE normalized = ? AND answer = ?",
+            (best, answer),
+        )
+        if not rows:
+            # 刚被别的进程淘汰
+            return None
+        self._touch(best, answer, now)
+        return self._entry(best, answer, *rows[0])
+
+    def _touch(self, normalized, answer, now):
+        self.db.execute(
+            "UPDATE cache_entries SET last_used = ? WHERE normalized = ? AND answer = ?",
+            (now, normalized, answer),
+        )
+
+    def _entry(self, normalized, answer, question, interpretation, expires_at):
+        grams = _grams(normalized)
+        return CacheEntry(
+            question=question,
+            answer=answer,
+            interpretation=interpretation,
+            grams=grams,
+            bands=lsh_bands(minhash(grams)),
+            expires_at=expires_at,
+        )
+
+    def _count(self, counter, amount=1):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + amount)
+
+
+class SQLiteBuckets:
+    """The scheduler's quota buckets, shared by every process using the same file.
+
+    Each call loads both buckets, refills them to the current wall-clock
+    time and writes them back inside one transaction. Concurrent workers
+    therefore never spend the same quota twice.
+    """
+
+    def __init__(self, db, requests_per_minute, tokens_per_minute):
+        self.db = db
+        self.limits = {
+            "requests": (requests_per_minute / 60, requests_per_minute),
+            "tokens": (tokens_per_minute / 60, tokens_per_minute),
+        }
+
+    def try_take(self, tokens, reserve=0.0):
+        with self.db.transaction() as conn:
+            requests, token_bucket = self._load(conn)
+            wait = take_quota(requests, token_bucket, tokens, reserve)
+            if wait == 0:
+                self._store(conn, requests=requests, tokens=token_bucket)
+        return wait
+
+    def adjust(self, amount):
+        with self.db.transaction() as conn:
+            requests, token_bucket = self._load(conn)
+            token_bucket.adjust(amount)
+            self._store(conn, tokens=token_bucket)
+
+    def available(self):
+        with self.db.transaction() as conn:
+            requests, token_bucket = self._load(conn)
+        return requests.tokens, token_bucket.tokens
+
+    def _load(self, conn):
+        stored = {
+            name: (tokens, updated)
+            for name, tokens, updated in conn.execute("SELECT name, tokens, updated FROM rate_buckets")
+        }
+        # 第一次使用时桶是满的；时间用墙上时钟，各进程之间才可比
+        return [
+            TokenBucket(rate, capacity, *stored.get(name, (None, None)), clock=time.time)
+            for name, (rate, capacity) in self.limits.items()
+        ]
+
+    def _store(self, conn, **buckets):
+        conn.executemany(
+            "INSERT INTO rate_buckets (name, tokens, updated) VALUES (?, ?, ?) "
+            "ON CONFLICT (name) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+            [(name, bucket.tokens, bucket.updated) for name, bucket in buckets.items()],
+        )
+
+
+class LocalState:
+    """Everything in this process; nothing is shared with other workers."""
+
+    shared = False
+
+    def interpretation_cache(self, max_entries, ttl_seconds):
+        return InterpretationCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    def rate_limit_buckets(self, requests_per_minute, tokens_per_minute):
+        return LocalBuckets(requests_per_minute, tokens_per_minute)
+
+    def history_store(self, path):
+        return HistoryStore(path)
+
+
+class SQLiteState(LocalState):
+    """Cache and quota in one SQLite file shared by the workers on this node."""
+
+    shared = True
+
+    def __init__(self, path):
+        self.db = StateDatabase(path)
+
+    def interpretation_cache(self, max_entries, ttl_seconds):
+        return SQLiteInterpretationCache(self.db, max_entries=max_entries, ttl_seconds=ttl_seconds)
+
+    def rate_limit_buckets(self, requests_per_minute, tokens_per_minute):
+        return SQLiteBuckets(self.db, requests_per_minute, tokens_per_minute)
+
+
+def open_state(backend, path):
+    """The state backend named ``backend``: ``local``, or ``sqlite`` stored at ``path``."""
+    if backend == "local":
+        return LocalState()
+    if backend == "sqlite":
+        return SQLiteState(path)
+    raise ValueError(f"Unknown state backend {backend!r}; expected 'local' or 'sqlite'")
@@ -0,0 +1,106 @@
+"""Background pool of pre-generated interpretations for every book answer.
+
+The book only has a few dozen answers, so the generic part of a reading can
+be prepared ahead of time. The pool keeps up to ``depth`` readings per answer
+and refills a slot in the background as soon as it is taken. At most
+``max_workers`` generation calls run at once.
+
+The workers are daemon threads, so a process with a half-filled pool still
+exits (or restarts) at once instead of first running every queued job.
+"""
+
+import queue
+import threading
+from collections import deque
+
+
+class WarmPool:
+    def __init__(self, answers, generate, depth=3, max_workers=2):
+        """``generate(answer)`` must return one interpretation string."""
+        self.answers = list(answers)
+        self.depth = depth
+        self._generate = generate
+        self._readings = {answer: deque() for answer in self.answers}
+        self._in_flight = {answer: 0 for answer in self.answers}
+        self._jobs = queue.Queue()
+        self._stopped = threading.Event()
+        self._lock = threading.Lock()
+        self.served = 0
+        self.dry = 0
+        self.generated = 0
+        self.errors = 0
+        for index in range(max_workers):
+            threading.Thread(target=self._work, name=f"warm-pool-{index}", daemon=True).start()
+
+    def start(self):
+        """Queue enough generation jobs to fill every answer up to ``depth``."""
+        for answer in self.answers:
+            self._refill(answer)
+        return self
+
+    def take(self, answer):
+        """Pop a ready reading for ``answer`` or return ``None`` if it ran dry."""
+        with self._lock:
+            readings = self._readings.setdefault(answer, deque())
+            self._in_flight.setdefault(answer, 0)
+            reading = readings.popleft() if readings else None
+            if reading is None:
+                self.dry += 1
+            else:
+                self.served += 1
+        self._refill(answer)
+        return reading
+
+    def stats(self):
+        with self._lock:
+            depths = {answer: len(readings) for answer, readings in self._readings.items()}
+            return {
+                "depth": sum(depths.values()),
+                "capacity": self.depth * len(depths),
+                "empty_answers": sum(1 for depth in depths.values() if depth == 0),
+                "in_flight": sum(self._in_flight.values()),
+                "served": self.served,
+                "dry": self.dry,
+                "dry_rate": self.dry / (self.served + self.dry) if self.served + self.dry else 0.0,
+                "generated": self.generated,
+                "errors": self.errors,
+            }
+
+    def shutdown(self):
+        """Drop the queued jobs; a call already running finishes on its own."""
+        self._stopped.set()
+        while True:
+            try:
+                self._jobs.get_nowait()
+            except queue.Empty:
+                break
+
+    def _refill(self, answer):
+        if self._stopped.is_set():
+            return
+        with self._lock:
+            missing = self.depth - len(self._readings[answer]) - self._in_flight[answer]
+            self._in_flight[answer] += max(missing, 0)
+        for _ in range(missing):
+            self._jobs.put(answer)
+
+    def _work(self):
+        while not self._stopped.is_set():
+            try:
+                answer = self._jobs.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            self._fill_one(answer)
+
+    def _fill_one(self, answer):
+        try:
+            reading = self._generate(answer)
+        except Exception:
+            with self._lock:
+                self._in_flight[answer] -= 1
+                self.errors += 1
+            return
+        with self._lock:
+            self._in_flight[answer] -= 1
+            self._readings[answer].append(reading)
+            self.generated += 1